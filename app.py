@@ -1,39 +1,158 @@
+import argparse
 import asyncio
-from flask import Flask, request
-from telegram import Update
-from telegram.ext import ApplicationBuilder, PicklePersistence
-from config import BOT_TOKEN
-from db import init_db
-from handlers.start import start, process_course, process_name, process_email
-from telegram.ext import CommandHandler, CallbackQueryHandler, MessageHandler, filters, ConversationHandler
-
-app = Flask(__name__)
-
-persistence = PicklePersistence(filepath="bot_data")
-application = ApplicationBuilder().token(BOT_TOKEN).persistence(persistence).build()
-
-conv_handler = ConversationHandler(
-    entry_points=[CommandHandler("start", start)],
-    states={
-        0: [CallbackQueryHandler(process_course, pattern=r'^course_')],
-        1: [MessageHandler(filters.TEXT & ~filters.COMMAND, process_name)],
-        2: [MessageHandler(filters.TEXT & ~filters.COMMAND, process_email)]
-    },
-    fallbacks=[]
-)
-application.add_handler(conv_handler)
-
-@app.route('/webhook', methods=['POST'])
-def webhook():
-    update = Update.de_json(request.get_json(force=True), application.bot)
-    application.update_queue.put(update)
-    return "OK"
-
-async def main():
-    await init_db()
-    await application.bot.set_webhook("https://YOUR_DOMAIN/webhook")
-    print("Бот готов и webhook установлен")
+import importlib
+import logging
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+# --- Реестр обработчиков ---
+# Модуль, объект обработчика (или список обработчиков) и группа. Модули
+# импортируются только при сборке приложения, поэтому новый раздел бота — это
+# одна строка здесь.
+HANDLERS = [
+    ("handlers.start", "registration_conv_handler", 0),
+    ("handlers.admin", "admin_conv_handler", 0),
+    ("handlers.admin", "role_handlers", 0),
+    ("handlers.enrollment", "leave_handlers", 0),
+]
+
+
+def load_handlers(registry=HANDLERS):
+    for module_name, attribute, group in registry:
+        handlers = getattr(importlib.import_module(module_name), attribute)
+        for handler in handlers if isinstance(handlers, list) else [handlers]:
+            yield handler, group
+
+
+async def on_startup(application):
+    from config import ADMIN_ID, smtp_configured
+    from db import init_db
+    from dedup import DEDUP_PERSIST, update_dedup
+    from roles import ensure_owner
+    from workers import current_shard
+
+    await init_db(application.persistence.path)
+    await ensure_owner(ADMIN_ID)
+    if DEDUP_PERSIST:
+        await update_dedup.start()
+    if smtp_configured():
+        from emails_utils import start_mail_queue
+        await start_mail_queue()
+    # Незавершённые рассылки продолжает только один воркер
+    shard = current_shard()
+    if shard is None or shard[0] == 0:
+        from broadcast import resume_broadcasts
+        await resume_broadcasts(application)
+
+
+async def on_shutdown(application):
+    import background
+    from config import smtp_configured
+    from db import close_db
+    from dedup import update_dedup
+
+    # serve() отменяет фоновые задачи ещё до stop(); здесь — на случай другого запуска
+    await background.cancel_all()
+    if smtp_configured():
+        from emails_utils import stop_mail_queue
+        await stop_mail_queue()
+    await update_dedup.stop()
+    await close_db()
+
+
+# --- Фабрика приложения ---
+def build_application(token=None, *, base_url=None, db_path=None, shard=None, registry=HANDLERS):
+    from telegram.ext import ApplicationBuilder
+
+    import config
+    import db
+    import ratelimit
+    import reminders
+    import sweeper
+    from persistence import SqlitePersistence
+    from webhook import update_queue
+    from workers import current_shard
+
+    token = token or config.BOT_TOKEN
+    if not token:
+        raise ValueError("Не задан BOT_TOKEN")
+    if not config.ADMIN_ID:
+        logger.warning("ADMIN_ID не задан — владелец бота должен уже быть в таблице admins")
+
+    builder = (
+        ApplicationBuilder()
+        .token(token)
+        .persistence(SqlitePersistence(db_path or db.DB_PATH, shard=shard or current_shard()))
+        .updater(None)
+        .update_queue(update_queue())
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    application = builder.build()
+    ratelimit.install(application)
+    sweeper.install(application)
+    reminders.install(application)
+    for handler, group in load_handlers(registry):
+        application.add_handler(handler, group=group)
+    return application
+
+
+# --- Замер холодного старта ---
+# Импорт PTB, каждого модуля из реестра, сборка приложения и открытие базы
+# с миграциями — всё, что происходит до приёма первого апдейта.
+LAZY_MODULES = ("emails_utils", "smtplib", "broadcast")
+
+
+async def profile_startup():
+    timings = []
+    modules_before = len(sys.modules)
+    started = time.perf_counter()
+
+    def step(label, func):
+        begin = time.perf_counter()
+        result = func()
+        timings.append((label, time.perf_counter() - begin))
+        return result
+
+    step("import telegram.ext", lambda: importlib.import_module("telegram.ext"))
+    step("import webhook", lambda: importlib.import_module("webhook"))
+    for module_name in dict.fromkeys(module_name for module_name, _, _ in HANDLERS):
+        step(f"import {module_name}", lambda name=module_name: importlib.import_module(name))
+    application = step("build_application", build_application)
+    from db import close_db, init_db
+
+    begin = time.perf_counter()
+    await init_db(application.persistence.path)
+    timings.append(("init_db", time.perf_counter() - begin))
+    total = time.perf_counter() - started
+    await close_db()
+
+    for label, elapsed in timings:
+        print(f"{label:<32}{elapsed * 1000:>10.1f} мс")
+    print(f"{'всего':<32}{total * 1000:>10.1f} мс")
+    print(f"Загружено модулей: {len(sys.modules) - modules_before}")
+    lazy = [name for name in LAZY_MODULES if name not in sys.modules]
+    eager = [name for name in LAZY_MODULES if name in sys.modules]
+    print(f"Не загружены до первого обращения: {', '.join(lazy) or '—'}")
+    if eager:
+        print(f"ВНИМАНИЕ: загружены при старте, хотя должны загружаться лениво: {', '.join(eager)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Telegram-бот регистрации на курсы")
+    parser.add_argument("--profile-startup", action="store_true", help="замерить холодный старт и выйти")
+    args = parser.parse_args()
+    logging.basicConfig(format="%(asctime)s [%(levelname)s] %(message)s", level=logging.INFO)
+    if args.profile_startup:
+        asyncio.run(profile_startup())
+        return
+    from webhook import serve
+    asyncio.run(serve(build_application()))
+
 
 if __name__ == "__main__":
-    asyncio.run(main())
-    app.run(port=5000)
+    main()
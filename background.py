@@ -0,0 +1,35 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# --- Долгие фоновые задачи ---
+# Рассылки и подобные им задачи идут минутами и часами и сохраняют прогресс
+# порциями, поэтому при остановке их можно просто отменить. Application.create_task
+# для них не годится: Application.stop() ждёт все такие задачи, и SIGTERM
+# блокировался бы до конца рассылки. serve() отменяет задачи отсюда до stop().
+_tasks = set()
+
+
+def _done(task):
+    _tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Фоновая задача {task.get_name()} упала: {task.exception()}", exc_info=task.exception())
+
+
+def spawn(coro, name=None):
+    task = asyncio.create_task(coro, name=name)
+    _tasks.add(task)
+    task.add_done_callback(_done)
+    return task
+
+
+async def cancel_all(timeout=10.0):
+    if not _tasks:
+        return
+    logger.info(f"Отмена фоновых задач: {len(_tasks)}")
+    tasks = list(_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.wait(tasks, timeout=timeout)
@@ -0,0 +1,50 @@
+# Бенчмарк рассылки против локальной заглушки Bot API: временная БД с N
+# пользователями, печатает скорость, число 429 и итог доставки.
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Bot
+
+import db
+from broadcast import Throttle, create_broadcast, run_broadcast
+from benchmarks.fake_bot_api import start_fake_api
+
+
+async def main(args):
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    await db.init_db(path)
+    async with db.pool.writer() as conn:
+        await conn.executemany(
+            "INSERT INTO users (course, name, telegram_id, email) VALUES ('js', 'Bench', ?, ?)",
+            ((1000 + i, f"user{i}@example.com") for i in range(args.users))
+        )
+    blocked = frozenset(1000 + i for i in range(0, args.users, args.blocked_every)) if args.blocked_every else frozenset()
+    runner, stats = await start_fake_api(args.port, blocked=blocked)
+    bot = Bot("123:BENCH", base_url=f"http://127.0.0.1:{args.port}/bot")
+    try:
+        await bot.initialize()
+        broadcast_id = await create_broadcast("Новый курс уже открыт!")
+        started = time.perf_counter()
+        sent, failed = await run_broadcast(bot, broadcast_id, Throttle(args.rate))
+        elapsed = time.perf_counter() - started
+    finally:
+        await bot.shutdown()
+        await runner.cleanup()
+        await db.close_db()
+    print(f"{args.users} получателей за {elapsed:.1f} с: {sent / elapsed:.1f} msg/s, "
+          f"доставлено {sent}, ошибок {failed}, ответов 429: {stats['throttled']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк рассылки")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=25)
+    parser.add_argument("--blocked-every", type=int, default=50)
+    parser.add_argument("--port", type=int, default=8081)
+    asyncio.run(main(parser.parse_args()))
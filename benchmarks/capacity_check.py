@@ -0,0 +1,118 @@
+# Проверка лимита мест под конкурентной нагрузкой: N пользователей одновременно
+# записываются на курс с capacity мест — из нескольких процессов, у каждого свой
+# пул соединений и своя пакетная запись в общий файл SQLite. Затем часть
+# записанных отменяет запись, и ожидающие должны переводиться строго по очереди.
+# Завершается с ошибкой, если записанных когда-либо больше capacity.
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+
+COURSE = "react"
+
+
+async def _register(path, user_ids):
+    await db.init_db(path)
+    try:
+        statuses = await asyncio.gather(*(
+            db.add_user(COURSE, f"User {user_id}", user_id, f"user{user_id}@example.com")
+            for user_id in user_ids
+        ))
+    finally:
+        await db.close_db()
+    return statuses
+
+
+def _worker(path, user_ids, start_at, results):
+    # Процессы стартуют одновременно, чтобы пачки разных процессов пересекались
+    time.sleep(max(0.0, start_at - time.time()))
+    results.put(asyncio.run(_register(path, user_ids)))
+
+
+async def _enrolled(status="enrolled"):
+    async with db.pool.reader() as conn:
+        async with conn.execute(
+            "SELECT telegram_id FROM users WHERE course = ? AND status = ? ORDER BY id", (COURSE, status)
+        ) as cursor:
+            return [row[0] for row in await cursor.fetchall()]
+
+
+def check(condition, message):
+    print(("OK   " if condition else "FAIL ") + message)
+    return condition
+
+
+async def verify(path, args):
+    await db.init_db(path)
+    ok = True
+    try:
+        enrolled, waitlisted = await _enrolled(), await _enrolled("waitlisted")
+        ok &= check(len(enrolled) == min(args.capacity, args.users),
+                    f"записано {len(enrolled)} из {args.capacity} мест")
+        ok &= check(len(waitlisted) == max(args.users - args.capacity, 0),
+                    f"в листе ожидания {len(waitlisted)}")
+        async with db.pool.reader() as conn:
+            async with conn.execute("SELECT COUNT(*) FROM email_outbox WHERE course = ?", (COURSE,)) as cursor:
+                letters = (await cursor.fetchone())[0]
+        ok &= check(letters == len(enrolled), f"писем в outbox {letters} — только записанным")
+        ok &= check(await db.seat_counter.remaining(COURSE) == args.capacity - len(enrolled),
+                    "счётчик мест сверен с БД")
+
+        # Отмены параллельно с новыми записями: лимит держится, очередь — FIFO
+        leaving = enrolled[:args.cancel]
+        results = await asyncio.gather(
+            *(db.cancel_registration(telegram_id, COURSE) for telegram_id in leaving),
+            *(db.add_user(COURSE, "Late", 10 ** 6 + i, f"late{i}@example.com") for i in range(args.cancel)),
+        )
+        promoted = [telegram_id for result in results[:len(leaving)] for telegram_id in result]
+        expected = waitlisted[:len(promoted)]
+        ok &= check(promoted == expected, f"переведено {len(promoted)} ожидающих в порядке записи")
+        ok &= check(len(await _enrolled()) <= args.capacity, f"после отмен записано {len(await _enrolled())}")
+    finally:
+        await db.close_db()
+    return ok
+
+
+def main(args):
+    path = os.path.join(tempfile.mkdtemp(), "capacity.db")
+    asyncio.run(_prepare(path, args.capacity))
+    user_ids = list(range(1, args.users + 1))
+    results = multiprocessing.Queue()
+    start_at = time.time() + 1.0
+    workers = [
+        multiprocessing.Process(target=_worker, args=(path, user_ids[i::args.processes], start_at, results))
+        for i in range(args.processes)
+    ]
+    for worker in workers:
+        worker.start()
+    statuses = [status for _ in workers for status in results.get()]
+    for worker in workers:
+        worker.join()
+    elapsed = time.time() - start_at
+    print(f"{len(statuses)} записей из {args.processes} процессов за {elapsed:.2f} с: "
+          f"{statuses.count(db.REGISTERED)} на курс, {statuses.count(db.WAITLISTED)} в лист ожидания")
+    ok = check(statuses.count(db.REGISTERED) == min(args.capacity, args.users), "ответы пользователям совпадают с лимитом")
+    ok &= asyncio.run(verify(path, args))
+    sys.exit(0 if ok else 1)
+
+
+async def _prepare(path, capacity):
+    await db.init_db(path)
+    await db.set_capacity(COURSE, capacity)
+    await db.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Проверка лимита мест на курсе")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--capacity", type=int, default=150)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--cancel", type=int, default=20, help="сколько записанных отменяют запись")
+    main(parser.parse_args())
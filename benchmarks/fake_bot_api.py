@@ -0,0 +1,73 @@
+# Локальная заглушка Bot API для бенчмарков: отвечает на методы бота без сети
+# и, как настоящий Telegram, возвращает 429 с retry_after при превышении
+# 30 сообщений/с в целом или 1 сообщения/с в один чат.
+import asyncio
+import itertools
+import time
+from collections import defaultdict, deque
+
+from aiohttp import web
+
+GLOBAL_LIMIT = 30
+CHAT_LIMIT = 1
+
+STATS_KEY = web.AppKey("stats", dict)
+
+
+def _message(chat_id, text, message_id):
+    return {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": int(chat_id), "type": "private"},
+        "text": text,
+    }
+
+
+def create_fake_api(latency=0.0, blocked=frozenset(), enforce_limits=True):
+    stats = {"sent": 0, "throttled": 0, "blocked": 0, "calls": defaultdict(int)}
+    recent = deque()
+    per_chat = {}
+    message_ids = itertools.count(1)
+
+    async def handle(request):
+        method = request.match_info["method"]
+        params = dict(await request.post()) if request.content_type != "application/json" else await request.json()
+        stats["calls"][method] += 1
+        if latency:
+            await asyncio.sleep(latency)
+        if method == "getMe":
+            return web.json_response({"ok": True, "result": {
+                "id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"
+            }})
+        if method != "sendMessage":
+            return web.json_response({"ok": True, "result": True})
+
+        chat_id = int(params["chat_id"])
+        if chat_id in blocked:
+            stats["blocked"] += 1
+            return web.json_response({"ok": False, "error_code": 403,
+                                      "description": "Forbidden: bot was blocked by the user"}, status=403)
+        now = time.monotonic()
+        while recent and now - recent[0] >= 1:
+            recent.popleft()
+        if enforce_limits and (len(recent) >= GLOBAL_LIMIT or now - per_chat.get(chat_id, -1) < 1 / CHAT_LIMIT):
+            stats["throttled"] += 1
+            return web.json_response({"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                                      "parameters": {"retry_after": 1}}, status=429)
+        recent.append(now)
+        per_chat[chat_id] = now
+        stats["sent"] += 1
+        return web.json_response({"ok": True, "result": _message(chat_id, params.get("text", ""), next(message_ids))})
+
+    app = web.Application()
+    app[STATS_KEY] = stats
+    app.router.add_post("/bot{token}/{method}", handle)
+    return app
+
+
+async def start_fake_api(port, **kwargs):
+    app = create_fake_api(**kwargs)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner, app[STATS_KEY]
@@ -0,0 +1,97 @@
+# Сравнение приёма апдейта: прежний путь (stdlib json из строки → Update.de_json
+# для каждого апдейта) и ingest.py (orjson из bytes → предклассификация →
+# de_json только для нужных). Смесь трафика — нажатия course_*, короткие
+# тексты, команды, доля повторов и апдейтов без обработчиков.
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Bot, Update
+
+import ingest
+from dedup import UpdateDedup
+from benchmarks.webhook_load import make_update
+
+
+def irrelevant_update(update_id):
+    user = {"id": 1000 + update_id % 500, "is_bot": False, "first_name": "Bench"}
+    chat = {"id": user["id"], "type": "private"}
+    if update_id % 2:
+        return {"update_id": update_id, "edited_message": {
+            "message_id": update_id, "date": int(time.time()), "edit_date": int(time.time()),
+            "chat": chat, "from": user, "text": "исправлено",
+        }}
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": int(time.time()), "chat": chat, "from": user,
+        "sticker": {"file_id": "x", "file_unique_id": "x", "width": 512, "height": 512,
+                    "is_animated": False, "is_video": False, "type": "regular"},
+    }}
+
+
+def build_bodies(count, duplicates, irrelevant, seed=1):
+    rng = random.Random(seed)
+    bodies = []
+    for update_id in range(1, count + 1):
+        roll = rng.random()
+        if bodies and roll < duplicates:
+            bodies.append(rng.choice(bodies[-50:]))
+            continue
+        data = irrelevant_update(update_id) if roll < duplicates + irrelevant else make_update(update_id)
+        bodies.append(json.dumps(data, ensure_ascii=False).encode())
+    return bodies
+
+
+def baseline(bodies, bot):
+    # Как было: aiohttp request.json() — decode в str и json.loads, затем de_json
+    for body in bodies:
+        Update.de_json(json.loads(body.decode()), bot)
+
+
+def fast_path(bodies, bot):
+    stage = ingest.Ingest(dedup=UpdateDedup())
+    for body in bodies:
+        data = stage.accept(ingest.loads(body))
+        if data is not None:
+            Update.de_json(data, bot)
+    return stage
+
+
+def measure(func, *args, repeat=3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main(args):
+    bot = Bot("123:BENCH")
+    bodies = build_bodies(args.updates, args.duplicates, args.irrelevant)
+    clean = build_bodies(args.updates, 0.0, 0.0)
+    print(f"JSON-парсер ingest: {'orjson' if ingest.orjson else 'stdlib json'}")
+    for title, data in (("без повторов и лишних", clean),
+                        (f"повторы {args.duplicates:.0%}, лишние {args.irrelevant:.0%}", bodies)):
+        base, _ = measure(baseline, data, bot)
+        fast, stage = measure(fast_path, data, bot)
+        print(f"{title}:")
+        print(f"  прежний путь {len(data) / base:>10.0f} updates/s")
+        print(f"  ingest       {len(data) / fast:>10.0f} updates/s  (x{base / fast:.2f}; "
+              f"принято {stage.accepted}, повторов {stage.duplicates}, лишних {stage.irrelevant})")
+    parse_base, _ = measure(lambda: [json.loads(b.decode()) for b in clean])
+    parse_fast, _ = measure(lambda: [ingest.loads(b) for b in clean])
+    print(f"только разбор JSON: x{parse_base / parse_fast:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк приёма апдейтов")
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--duplicates", type=float, default=0.05, help="доля повторных апдейтов")
+    parser.add_argument("--irrelevant", type=float, default=0.15, help="доля апдейтов без обработчиков")
+    main(parser.parse_args())
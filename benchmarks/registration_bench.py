@@ -0,0 +1,213 @@
+# Нагрузочный прогон всего сценария регистрации: N пользователей параллельно
+# проходят COURSE → NAME → CONFIRM → EMAIL. Апдейты идут через тот же
+# aiohttp-обработчик /webhook, бот ходит в локальную заглушку Bot API, база —
+# временный файл SQLite. Печатает p50/p95/p99 по шагам, updates/s и число
+# обращений к БД на одну регистрацию. С --smtp письма уходят в локальный aiosmtpd.
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123:BENCH")
+os.environ.setdefault("ADMIN_ID", "1")
+
+from aiohttp import ClientSession, web
+from telegram import Update
+from telegram.ext import TypeHandler
+
+import db
+import email_validation
+import metrics
+from benchmarks.fake_bot_api import start_fake_api
+from webhook import WEBHOOK_PATH, create_webhook_app
+
+STEPS = ("start", "course", "name", "confirm", "email")
+
+
+class Tracker:
+    def __init__(self):
+        self.pending = {}
+        self.latencies = {step: [] for step in STEPS}
+
+    def expect(self, update_id, step):
+        done = asyncio.get_running_loop().create_future()
+        self.pending[update_id] = (step, time.perf_counter(), done)
+        return done
+
+    async def __call__(self, update, context):
+        step, sent_at, done = self.pending.pop(update.update_id)
+        self.latencies[step].append(time.perf_counter() - sent_at)
+        done.set_result(None)
+
+
+def _user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": "Bench"}
+
+
+def _message(update_id, user_id, text):
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": _user(user_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+    return {"update_id": update_id, "message": message}
+
+
+def _callback(update_id, user_id, data):
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "text": "…",
+            },
+        },
+    }
+
+
+async def simulate_user(session, url, tracker, ids, user_id, course):
+    script = (
+        ("start", lambda i: _message(i, user_id, "/start")),
+        ("course", lambda i: _callback(i, user_id, f"course_{course}")),
+        ("name", lambda i: _message(i, user_id, f"Пользователь {user_id}")),
+        ("confirm", lambda i: _callback(i, user_id, "confirm_name")),
+        ("email", lambda i: _message(i, user_id, f"user{user_id}@example.com")),
+    )
+    for step, build in script:
+        update_id = next(ids)
+        done = tracker.expect(update_id, step)
+        async with session.post(url, json=build(update_id)) as resp:
+            resp.raise_for_status()
+        await done
+
+
+def start_smtp(port):
+    from aiosmtpd.controller import Controller
+
+    class Sink:
+        received = 0
+
+        async def handle_DATA(self, server, session, envelope):
+            Sink.received += 1
+            return "250 OK"
+
+    controller = Controller(Sink(), hostname="127.0.0.1", port=port)
+    controller.start()
+    os.environ.update({
+        "SMTP_SERVER": "127.0.0.1", "SMTP_PORT": str(port), "SMTP_USER": "bench",
+        "SMTP_PASSWORD": "bench", "FROM_EMAIL": "bench@example.com", "SMTP_STARTTLS": "0",
+    })
+    return controller, Sink
+
+
+def build_application(args, api_url, db_path, tracker):
+    # Импорт после start_smtp: config читает SMTP_* из окружения при загрузке
+    import app
+
+    application = app.build_application(base_url=api_url, db_path=db_path)
+    # Без обращений к настоящему DNS: все адреса бенчмарка на example.com
+    email_validation.resolver = email_validation.StubResolver({"example.com": ["mx.example.com"]})
+    if args.smtp:
+        import emails_utils
+
+        # У aiosmtpd нет AUTH — отправляем без логина
+        emails_utils.mail_queue.user = None
+    application.add_handler(TypeHandler(Update, tracker), group=1)
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+    return application
+
+
+def _percentiles(values):
+    if len(values) < 2:
+        return values * 3 if values else [0.0] * 3
+    q = statistics.quantiles(values, n=100)
+    return q[49], q[94], q[98]
+
+
+def _db_ops():
+    return sum(sum(child.counts) for child in metrics.DB_QUERY_LATENCY._children.values())
+
+
+async def main(args):
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    smtp = start_smtp(args.smtp_port) if args.smtp else None
+    api_runner, _ = await start_fake_api(args.api_port, latency=args.api_latency, enforce_limits=False)
+    tracker = Tracker()
+    application = build_application(args, f"http://127.0.0.1:{args.api_port}/bot", db_path, tracker)
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+    runner = web.AppRunner(create_webhook_app(application, None))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+
+    url = f"http://127.0.0.1:{args.port}{WEBHOOK_PATH}"
+    ids = itertools.count(1)
+    courses = list(await db.get_courses())
+    ops_before = _db_ops()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def run_user(user_id):
+        async with semaphore:
+            await simulate_user(session, url, tracker, ids, user_id, courses[user_id % len(courses)])
+
+    try:
+        async with ClientSession() as session:
+            started = time.perf_counter()
+            await asyncio.gather(*(run_user(100000 + i) for i in range(args.users)))
+            elapsed = time.perf_counter() - started
+        async with db.pool.reader() as conn:
+            async with conn.execute("SELECT COUNT(*) FROM users") as cursor:
+                registered = (await cursor.fetchone())[0]
+        ops = _db_ops() - ops_before
+    finally:
+        await runner.cleanup()
+        await application.stop()
+        await application.shutdown()
+        await application.post_shutdown(application)
+        await api_runner.cleanup()
+        if smtp:
+            smtp[0].stop()
+
+    updates = args.users * len(STEPS)
+    print(f"Пользователей: {args.users}, параллельно: {args.concurrency}, зарегистрировано: {registered}")
+    print(f"Апдейтов: {updates} за {elapsed:.2f} с — {updates / elapsed:.0f} updates/s")
+    print(f"Обращений к БД на регистрацию: {ops / max(registered, 1):.2f}")
+    if smtp:
+        print(f"Писем получено SMTP-заглушкой: {smtp[1].received}")
+    print(f"{'шаг':<10}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}")
+    for step in STEPS + ("всего",):
+        values = tracker.latencies[step] if step in tracker.latencies else list(
+            itertools.chain.from_iterable(tracker.latencies.values()))
+        p50, p95, p99 = _percentiles(values)
+        print(f"{step:<10}{p50 * 1000:>10.1f}{p95 * 1000:>10.1f}{p99 * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон регистрации")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа заглушки Bot API, с")
+    parser.add_argument("--port", type=int, default=8444)
+    parser.add_argument("--api-port", type=int, default=8082)
+    parser.add_argument("--smtp", action="store_true", help="слать письма в локальный aiosmtpd")
+    parser.add_argument("--smtp-port", type=int, default=8025)
+    parser.add_argument("--verbose", action="store_true", help="не глушить логи бота")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,92 @@
+# Генератор нагрузки для webhook: шлёт синтетические апдейты и печатает updates/s.
+# Без --url поднимает webhook-сервер локально; очередь апдейтов разбирается
+# без обработчиков, так что измеряется только приём.
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import ClientSession, TCPConnector, web
+from telegram.ext import ApplicationBuilder
+
+from webhook import SECRET_HEADER, WEBHOOK_PATH, create_webhook_app, update_queue
+
+SECRET = "bench-secret"
+
+
+def make_update(update_id):
+    user = {"id": 1000 + update_id % 500, "is_bot": False, "first_name": "Bench"}
+    if update_id % 2:
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": user,
+                "chat_instance": "bench",
+                "data": "course_js",
+            },
+        }
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user["id"], "type": "private"},
+            "from": user,
+            "text": "Иван Петров",
+        },
+    }
+
+
+async def drain(queue):
+    while True:
+        await queue.get()
+        queue.task_done()
+
+
+async def fire(url, total, concurrency):
+    ids = itertools.count(1)
+    headers = {SECRET_HEADER: SECRET}
+
+    async def client(session):
+        while (update_id := next(ids)) <= total:
+            async with session.post(url, json=make_update(update_id), headers=headers) as resp:
+                resp.raise_for_status()
+
+    async with ClientSession(connector=TCPConnector(limit=concurrency)) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+
+async def main(args):
+    runner = None
+    url = args.url
+    if url is None:
+        application = ApplicationBuilder().token("123:BENCH").updater(None).update_queue(update_queue()).build()
+        runner = web.AppRunner(create_webhook_app(application, SECRET))
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", args.port).start()
+        drainer = asyncio.create_task(drain(application.update_queue))
+        url = f"http://127.0.0.1:{args.port}{WEBHOOK_PATH}"
+    try:
+        elapsed = await fire(url, args.requests, args.concurrency)
+    finally:
+        if runner is not None:
+            drainer.cancel()
+            await runner.cleanup()
+    print(f"{args.requests} апдейтов за {elapsed:.2f} с: {args.requests / elapsed:.0f} updates/s "
+          f"(параллельно {args.concurrency})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест webhook")
+    parser.add_argument("--url", help="адрес запущенного webhook, по умолчанию — локальный сервер")
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
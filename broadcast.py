@@ -0,0 +1,139 @@
+import asyncio
+import datetime as dt
+import logging
+import os
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+import background
+from db import pool, user_repo
+from repos import BroadcastRepo
+
+logger = logging.getLogger(__name__)
+
+# Глобальный лимит Telegram — 30 сообщений/с, оставляем запас
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", 25))
+BROADCAST_CHAT_RATE = float(os.getenv("BROADCAST_CHAT_RATE", 1))
+BROADCAST_CHUNK = int(os.getenv("BROADCAST_CHUNK", 200))
+BROADCAST_RETRIES = 5
+
+broadcast_repo = BroadcastRepo(pool)
+
+
+# --- Ограничение исходящих сообщений ---
+# Выдаёт каждому сообщению слот времени: не чаще rate в секунду в целом и
+# не чаще chat_rate в секунду в один чат. RetryAfter ставит отправку на паузу:
+# слоты, выданные до неё, недействительны — их владельцы встают в очередь заново
+# после паузы, иначе уже запланированные сообщения уходили бы во время flood wait.
+class Throttle:
+    def __init__(self, rate=BROADCAST_RATE, chat_rate=BROADCAST_CHAT_RATE):
+        self.interval = 1 / rate
+        self.chat_interval = 1 / chat_rate
+        self._next = 0.0
+        self._chats = {}
+        self._paused_until = 0.0
+        self._pauses = 0
+
+    async def wait(self, chat_id):
+        loop = asyncio.get_running_loop()
+        earliest = self._chats.get(chat_id, 0.0)
+        while True:
+            now = loop.time()
+            pauses = self._pauses
+            slot = max(now, self._next, self._paused_until, earliest)
+            self._next = slot + self.interval
+            self._chats[chat_id] = slot + self.chat_interval
+            if len(self._chats) > 10000:
+                self._chats = {chat: at for chat, at in self._chats.items() if at > now}
+            if slot > now:
+                await asyncio.sleep(slot - now)
+            if self._pauses == pauses:
+                return
+
+    def pause(self, seconds):
+        until = asyncio.get_running_loop().time() + seconds
+        if until > self._paused_until:
+            self._paused_until = until
+            self._next = until
+            self._pauses += 1
+
+
+default_throttle = Throttle()
+
+
+def _seconds(retry_after):
+    if isinstance(retry_after, dt.timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+async def send_throttled(bot, throttle, chat_id, text):
+    for attempt in range(BROADCAST_RETRIES):
+        await throttle.wait(chat_id)
+        try:
+            await bot.send_message(chat_id, text)
+            return True
+        except RetryAfter as e:
+            logger.warning(f"Flood control, пауза {e.retry_after} с")
+            throttle.pause(_seconds(e.retry_after))
+        except (Forbidden, BadRequest):
+            # Пользователь заблокировал бота или чат недоступен — повтор не поможет
+            return False
+        except NetworkError as e:
+            logger.warning(f"Сетевая ошибка при отправке в {chat_id}: {e}")
+            await asyncio.sleep(2 ** attempt)
+    return False
+
+
+# --- Рассылки ---
+# Получатели читаются из users порциями по telegram_id (keyset-пагинация по индексу),
+# после каждой порции прогресс сохраняется в broadcasts — прерванная рассылка
+# продолжается с последнего сохранённого telegram_id.
+async def create_broadcast(text):
+    async with pool.writer() as db:
+        return await broadcast_repo.fetchvalue("create", (text,), db)
+
+
+async def _recipients(after):
+    return [row[0] for row in await user_repo.fetchall("recipients_after", (after, BROADCAST_CHUNK))]
+
+
+async def run_broadcast(bot, broadcast_id, throttle=None, notify_chat_id=None):
+    throttle = throttle or default_throttle
+    text, last, sent, failed = await broadcast_repo.fetchone("get", (broadcast_id,))
+    logger.info(f"Рассылка #{broadcast_id} запущена с telegram_id > {last}")
+    while chunk := await _recipients(last):
+        results = await asyncio.gather(*(send_throttled(bot, throttle, chat_id, text) for chat_id in chunk))
+        delivered = sum(results)
+        sent += delivered
+        failed += len(results) - delivered
+        last = chunk[-1]
+        async with pool.writer() as db:
+            await broadcast_repo.execute(db, "progress", (last, sent, failed, broadcast_id))
+    async with pool.writer() as db:
+        await broadcast_repo.execute(db, "finish", (broadcast_id,))
+    logger.info(f"Рассылка #{broadcast_id} завершена: доставлено {sent}, ошибок {failed}")
+    if notify_chat_id:
+        await bot.send_message(notify_chat_id, f"📣 Рассылка #{broadcast_id} завершена: доставлено {sent}, ошибок {failed}")
+    return sent, failed
+
+
+def start_broadcast(bot, broadcast_id, notify_chat_id=None):
+    # Задача не через Application.create_task — см. background.py
+    return background.spawn(
+        run_broadcast(bot, broadcast_id, notify_chat_id=notify_chat_id), name=f"broadcast_{broadcast_id}"
+    )
+
+
+async def _resume(context):
+    for (broadcast_id,) in await broadcast_repo.fetchall("running"):
+        start_broadcast(context.bot, broadcast_id)
+
+
+async def resume_broadcasts(application):
+    # Вызывается из post_init, до Application.start(): продолжение откладывается
+    # в JobQueue, которая запускается вместе с приложением
+    if application.job_queue is not None:
+        application.job_queue.run_once(_resume, when=0, name="resume_broadcasts")
+    else:
+        await _resume(application)
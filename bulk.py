@@ -0,0 +1,152 @@
+import csv
+import json
+import os
+import tempfile
+
+import db
+
+FORMATS = ("csv", "json")
+JSON_READ_CHUNK = 64 * 1024
+_WHITESPACE = " \t\r\n"
+
+
+# --- Потоковый разбор JSON-массива ---
+# Файл читается кусками, элементы массива разбираются по одному через
+# JSONDecoder.raw_decode: в памяти только текущий кусок и недоразобранный хвост.
+def iter_json_array(f, chunk=JSON_READ_CHUNK):
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+    started = after_item = False
+
+    def skip():
+        nonlocal pos
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+
+    while True:
+        skip()
+        if pos >= len(buffer) and not eof:
+            data = f.read(chunk)
+            buffer, pos, eof = buffer[pos:] + data, 0, not data
+            continue
+        if not started:
+            if buffer[pos:pos + 1] != "[":
+                raise ValueError("JSON должен содержать массив объектов")
+            pos += 1
+            started = True
+            continue
+        if buffer[pos:pos + 1] == "]":
+            return
+        if pos >= len(buffer):
+            raise ValueError("Файл JSON оборван")
+        if after_item:
+            if buffer[pos] != ",":
+                raise ValueError("Некорректный JSON")
+            pos += 1
+            after_item = False
+            continue
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            item, end = None, None
+        # Элемент, дошедший до конца буфера, мог оборваться на границе куска
+        # (число 12|3) — дочитываем и разбираем заново
+        if end is None or (end == len(buffer) and not eof):
+            if eof:
+                raise ValueError("Некорректный JSON")
+            data = f.read(chunk)
+            buffer, pos, eof = buffer[pos:] + data, 0, not data
+            continue
+        pos, after_item = end, True
+        yield item
+
+
+# --- Разбор файлов импорта ---
+# Строки отдаются генератором прямо в executemany: CSV читается построчно,
+# JSON — массив объектов, по одному элементу (iter_json_array). Некорректные
+# строки, в том числе элементы JSON, не являющиеся объектами, пропускаются и считаются.
+class ImportFile:
+    def __init__(self, path, fmt):
+        self.path = path
+        self.fmt = fmt
+        self.skipped = 0
+
+    def records(self):
+        with open(self.path, encoding="utf-8-sig", newline="") as f:
+            if self.fmt == "csv":
+                yield from csv.DictReader(f)
+            else:
+                for record in iter_json_array(f):
+                    if isinstance(record, dict):
+                        yield record
+                    else:
+                        self.skipped += 1
+
+    def courses(self):
+        for record in self.records():
+            code = str(record.get("code") or "").strip().lower()
+            name = str(record.get("name") or "").strip()
+            if not db.valid_code(code) or not name:
+                self.skipped += 1
+                continue
+            yield code, name
+
+    def users(self):
+        for record in self.records():
+            try:
+                row = (
+                    str(record["course"]).strip().lower(),
+                    str(record["name"]).strip(),
+                    int(record["telegram_id"]),
+                    str(record["email"]).strip(),
+                )
+            except (KeyError, TypeError, ValueError):
+                self.skipped += 1
+                continue
+            if not all(row):
+                self.skipped += 1
+                continue
+            yield row
+
+
+def detect(filename):
+    # users.csv, courses-2024.json и т.п.: таблица по префиксу, формат по расширению
+    base, ext = os.path.splitext(filename.lower())
+    fmt = ext.lstrip(".")
+    table = next((name for name in db.EXPORTS if base.startswith(name)), None)
+    if table is None or fmt not in FORMATS:
+        return None
+    return table, fmt
+
+
+async def import_file(path, table, fmt):
+    source = ImportFile(path, fmt)
+    if table == "courses":
+        changed = await db.import_courses(source.courses())
+    else:
+        changed = await db.import_users(source.users())
+    return changed, source.skipped
+
+
+# --- Экспорт ---
+# Строки пишутся во временный файл на диске по мере чтения из БД, так что
+# таблица не собирается в памяти целиком. Файл удаляет вызывающий.
+async def export_file(table, fmt):
+    _, columns = db.EXPORTS[table]
+    fd, path = tempfile.mkstemp(prefix=f"{table}-", suffix=f".{fmt}")
+    count = 0
+    with open(fd, "w", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            async for row in db.export_rows(table):
+                writer.writerow(row)
+                count += 1
+        else:
+            f.write("[")
+            async for row in db.export_rows(table):
+                f.write(",\n" if count else "\n")
+                f.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+                count += 1
+            f.write("\n]\n")
+    return path, count
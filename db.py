@@ -1,60 +1,448 @@
 import aiosqlite
 import asyncio
+import logging
+import os
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+from types import MappingProxyType
+
+import metrics
+from migrations import migrate
+from repos import CourseRepo, UserRepo
 
 DB_PATH = "registrations.db"
+DB_READERS = int(os.getenv("DB_READERS", 4))
+# Размер кэша подготовленных выражений sqlite3 на каждое соединение пула
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", 256))
+# 0 — кэш курсов живёт до явного обновления; для нескольких процессов задайте TTL в секундах
+COURSE_CACHE_TTL = float(os.getenv("COURSE_CACHE_TTL", 0))
+# Окно и размер пачки, в которые группируются вставки регистраций
+REG_BATCH_WINDOW = float(os.getenv("REG_BATCH_WINDOW_MS", 10)) / 1000
+REG_BATCH_SIZE = int(os.getenv("REG_BATCH_SIZE", 100))
+
+# Настройки каждого соединения; journal_mode=WAL сохраняется в самом файле БД
+PRAGMAS = {
+    "synchronous": "NORMAL",
+    "busy_timeout": int(os.getenv("DB_BUSY_TIMEOUT_MS", 5000)),
+    "cache_size": -int(os.getenv("DB_CACHE_KB", 16384)),
+    "mmap_size": int(os.getenv("DB_MMAP_SIZE", 256 * 1024 * 1024)),
+    "temp_store": "MEMORY",
+}
+
+logger = logging.getLogger(__name__)
+
+
+# --- Пул соединений ---
+# Фиксированный набор читающих соединений и одно пишущее, доступ к которому
+# сериализован блокировкой. Открывается один раз при старте и закрывается при остановке.
+class ConnectionPool:
+    def __init__(self, readers=DB_READERS):
+        self.size = readers
+        self.path = None
+        self._readers = None
+        self._all = []
+        self._writer = None
+        self._write_lock = None
+
+    @property
+    def is_open(self):
+        return self._writer is not None
+
+    async def open(self, path=DB_PATH):
+        if self.is_open:
+            return
+        self.path = path
+        self._readers = asyncio.Queue()
+        self._write_lock = asyncio.Lock()
+        self._writer = await self._connect(path)
+        async with self._writer.execute("PRAGMA journal_mode = WAL"):
+            pass
+        for _ in range(self.size):
+            conn = await self._connect(path)
+            self._all.append(conn)
+            self._readers.put_nowait(conn)
+
+    @staticmethod
+    async def _connect(path):
+        conn = await aiosqlite.connect(path, cached_statements=DB_STATEMENT_CACHE)
+        for name, value in PRAGMAS.items():
+            async with conn.execute(f"PRAGMA {name} = {value}"):
+                pass
+        return conn
+
+    async def close(self):
+        if not self.is_open:
+            return
+        async with self._write_lock:
+            await self._writer.close()
+            self._writer = None
+        for conn in self._all:
+            await conn.close()
+        self._all.clear()
+        self._readers = None
+
+    @asynccontextmanager
+    async def reader(self):
+        conn = await self._readers.get()
+        started = time.perf_counter()
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+            _READ_LATENCY.observe(time.perf_counter() - started)
+
+    @asynccontextmanager
+    async def writer(self):
+        async with self._write_lock:
+            started = time.perf_counter()
+            try:
+                yield self._writer
+            except BaseException:
+                await self._writer.rollback()
+                raise
+            else:
+                await self._writer.commit()
+            finally:
+                _WRITE_LATENCY.observe(time.perf_counter() - started)
+
+
+_READ_LATENCY = metrics.DB_QUERY_LATENCY.labels("read")
+_WRITE_LATENCY = metrics.DB_QUERY_LATENCY.labels("write")
+
+pool = ConnectionPool()
+course_repo = CourseRepo(pool)
+user_repo = UserRepo(pool)
+
+
+# --- Кэш каталога курсов ---
+# Загружается в init_db, обновляется явно после записи в courses.
+class CourseCache:
+    def __init__(self, ttl=COURSE_CACHE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._courses = None
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self):
+        if self._courses is None:
+            return False
+        return not self.ttl or time.monotonic() - self._loaded_at < self.ttl
+
+    async def get(self):
+        if self._is_fresh():
+            self.hits += 1
+            return self._courses
+        self.misses += 1
+        async with self._lock:
+            if not self._is_fresh():
+                await self.refresh()
+            return self._courses
+
+    async def refresh(self):
+        courses = dict(await course_repo.fetchall("all"))
+        self._courses = MappingProxyType(courses)
+        self._loaded_at = time.monotonic()
+        return self._courses
+
+    def update(self, changed=None, removed=()):
+        # Точечная правка без похода в БД. Новый объект вместо изменения старого:
+        # по смене объекта keyboards понимает, что готовые клавиатуры устарели.
+        if self._courses is None:
+            return
+        courses = dict(self._courses)
+        courses.update(changed or {})
+        for code in removed:
+            courses.pop(code, None)
+        self._courses = MappingProxyType(courses)
+
+    def invalidate(self):
+        self._courses = None
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._courses or {})}
+
+
+course_cache = CourseCache()
+metrics.COURSE_CACHE_HITS.set_function(lambda: course_cache.hits)
+metrics.COURSE_CACHE_MISSES.set_function(lambda: course_cache.misses)
+
+
+# --- Счётчик свободных мест ---
+# Остаток мест по курсам в памяти: для подсказки «мест нет» без похода в БД.
+# Место резервирует только сама вставка (см. registrations), поэтому счётчик
+# может отставать от базы; он сверяется с SQLite раз в SEAT_COUNTER_TTL секунд
+# и сдвигается на известные этому процессу записи и отмены между сверками.
+SEAT_COUNTER_TTL = float(os.getenv("SEAT_COUNTER_TTL", 30))
+
+
+class SeatCounter:
+    def __init__(self, ttl=SEAT_COUNTER_TTL):
+        self.ttl = ttl
+        self._seats = {}
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self):
+        return self._loaded_at and time.monotonic() - self._loaded_at < self.ttl
+
+    async def remaining(self, code):
+        # None — курс без ограничения мест
+        if not self._is_fresh():
+            async with self._lock:
+                if not self._is_fresh():
+                    await self.reconcile()
+        return self._seats.get(code)
+
+    async def reconcile(self):
+        self._seats = {code: max(left, 0) for code, left in await course_repo.fetchall("free_seats")}
+        self._loaded_at = time.monotonic()
+        return self._seats
 
-async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                course TEXT,
-                name TEXT,
-                telegram_id INTEGER,
-                email TEXT
-            )
-        """)
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS courses (
-                code TEXT PRIMARY KEY,
-                name TEXT
-            )
-        """)
-        await db.execute("""
-            CREATE UNIQUE INDEX IF NOT EXISTS idx_user_email 
-            ON users(telegram_id, email)
-        """)
-        await db.execute("""
-            CREATE UNIQUE INDEX IF NOT EXISTS idx_user_course 
-            ON users(telegram_id, course)
-        """)
-        # Добавление дефолтных курсов
-        async with db.execute("SELECT COUNT(*) FROM courses") as cursor:
-            count = (await cursor.fetchone())[0]
-            if count == 0:
-                default_courses = {
-                    "html": "HTML & CSS для начинающих",
-                    "js": "JavaScript с нуля",
-                    "react": "React.js для создания интерфейсов"
-                }
-                for code, name in default_courses.items():
-                    await db.execute("INSERT INTO courses (code, name) VALUES (?, ?)", (code, name))
-        await db.commit()
+    def taken(self, code, count=1):
+        if self._seats.get(code) is not None:
+            self._seats[code] = max(self._seats[code] - count, 0)
+
+    def released(self, code, count=1):
+        if self._seats.get(code) is not None:
+            self._seats[code] += count
+
+    def invalidate(self):
+        self._loaded_at = 0.0
+
+
+seat_counter = SeatCounter()
+
+
+# --- Пакетная запись ---
+# Вставки, пришедшие в пределах короткого окна, выполняются в одной транзакции
+# (один commit/fsync на пачку). Каждая строка обёрнута в SAVEPOINT, поэтому
+# нарушение уникальности откатывает только её, а вызывающий получает свою ошибку.
+# Результат для вызывающего — строка из RETURNING (или None, если вставки не было).
+# query и then — имена запросов репозитория; then выполняется в том же SAVEPOINT
+# после успешной вставки, к параметрам строки добавляется :id из RETURNING.
+class BatchWriter:
+    def __init__(self, repo, query, then=None, window=REG_BATCH_WINDOW, max_batch=REG_BATCH_SIZE):
+        self.repo = repo
+        self.query = query
+        self.then = then
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.rows = 0
+        self._queue = None
+        self._task = None
+
+    async def submit(self, params):
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((params, future))
+        return await future
+
+    async def close(self):
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    def _drain(self, batch):
+        # Возвращает True, если в очереди встретился маркер остановки
+        while len(batch) < self.max_batch and not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is None:
+                return True
+            batch.append(item)
+        return False
+
+    async def _run(self):
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            if self._queue.qsize() < self.max_batch - 1:
+                await asyncio.sleep(self.window)
+            stop = self._drain(batch)
+            await self._flush(batch)
+            if stop:
+                return
+
+    async def _flush(self, batch):
+        results = []
+        try:
+            async with pool.writer() as db:
+                await db.execute("BEGIN IMMEDIATE")
+                for params, _ in batch:
+                    await db.execute("SAVEPOINT row")
+                    try:
+                        row = await self.repo.fetchone(self.query, params, db)
+                        if row is not None and self.then:
+                            await self.repo.execute(db, self.then, {**params, "id": row[0]})
+                        results.append(row)
+                    except sqlite3.IntegrityError as e:
+                        await db.execute("ROLLBACK TO row")
+                        results.append(e)
+                    await db.execute("RELEASE row")
+        except Exception as e:
+            logger.error(f"Ошибка пакетной записи ({len(batch)} строк): {e}", exc_info=True)
+            results = [e] * len(batch)
+        self.batches += 1
+        self.rows += len(batch)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+# Вставка и проверка email — один запрос UserRepo "register". Пачка идёт под
+# BEGIN IMMEDIATE, поэтому подсчёт занятых мест и вставка не пересекаются с
+# другими писателями (в том числе из других процессов). Письмо с подтверждением
+# попадает в email_outbox той же транзакцией и не теряется, если процесс упадёт
+# до отправки; ожидающим письмо уходит при переводе на курс.
+registrations = BatchWriter(user_repo, "register", then="queue_confirmation")
+
+REGISTERED, EMAIL_TAKEN, ALREADY_REGISTERED = "registered", "email_taken", "already_registered"
+WAITLISTED = "waitlisted"
+
+
+async def init_db(path=DB_PATH):
+    await pool.open(path)
+    async with pool.writer() as db:
+        await migrate(db)
+    await course_cache.refresh()
+    await seat_counter.reconcile()
+
+async def close_db():
+    await registrations.close()
+    course_cache.invalidate()
+    seat_counter.invalidate()
+    await pool.close()
+
+# Код курса попадает в callback_data кнопок («course_<код>», «leave_<код>»),
+# а Telegram ограничивает её 64 байтами
+MAX_CODE_LENGTH = 32
+
+
+def valid_code(code):
+    return code.isascii() and code.isalnum() and len(code) <= MAX_CODE_LENGTH
 
 async def get_courses():
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT code, name FROM courses") as cursor:
-            return dict(await cursor.fetchall())
+    return await course_cache.get()
+
+async def add_course(code, name):
+    async with pool.writer() as db:
+        await course_repo.execute(db, "add", (code, name))
+    course_cache.update({code: name})
+
+async def rename_course(code, name):
+    async with pool.writer() as db:
+        renamed = await course_repo.execute(db, "rename", (name, code)) > 0
+    if renamed:
+        course_cache.update({code: name})
+    return renamed
+
+async def delete_course(code):
+    # Курс с записями не удаляется: возвращаем число записанных, 0 — курс удалён
+    # BEGIN IMMEDIATE: между подсчётом и удалением никто не успеет записаться
+    async with pool.writer() as db:
+        await db.execute("BEGIN IMMEDIATE")
+        registered = await course_repo.fetchvalue("registered", (code,), db)
+        if registered:
+            return registered
+        await course_repo.execute(db, "delete", (code,))
+    course_cache.update(removed=[code])
+    return 0
+
+# --- Места и лист ожидания ---
+async def _promote(db, course, count):
+    # Первые count ожидающих в порядке записи (id растёт) переводятся на курс,
+    # письма с подтверждением — в outbox той же транзакцией
+    if count <= 0:
+        return []
+    promoted = await user_repo.fetchall("promote", (course, count), db)
+    await user_repo.executemany(
+        db, "queue_confirmations", [(user_id, email, course) for user_id, _, email in promoted]
+    )
+    return [telegram_id for _, telegram_id, _ in promoted]
+
+async def cancel_registration(telegram_id, course):
+    # None — записи не было, иначе список telegram_id переведённых из листа ожидания
+    async with pool.writer() as db:
+        await db.execute("BEGIN IMMEDIATE")
+        row = await user_repo.fetchone("cancel", (telegram_id, course), db)
+        if row is None:
+            return None
+        promoted = await _promote(db, course, 1) if row[0] == "enrolled" else []
+    if row[0] == "enrolled" and not promoted:
+        seat_counter.released(course)
+    return promoted
+
+async def set_capacity(code, capacity):
+    # capacity=None снимает ограничение; освободившиеся места сразу занимают ожидающие.
+    # None — курса нет, иначе список telegram_id переведённых на курс
+    async with pool.writer() as db:
+        await db.execute("BEGIN IMMEDIATE")
+        if not await course_repo.execute(db, "set_capacity", (capacity, code)):
+            return None
+        if capacity is None:
+            free = await user_repo.fetchvalue("count_status", (code, "waitlisted"), db)
+        else:
+            free = capacity - await user_repo.fetchvalue("count_status", (code, "enrolled"), db)
+        promoted = await _promote(db, code, free)
+    await seat_counter.reconcile()
+    return promoted
+
+async def get_capacity(code):
+    # (capacity, занято, ожидают); capacity=None — без ограничения
+    return await course_repo.fetchone("capacity", {"code": code})
+
+# --- Массовый импорт и экспорт ---
+# Импорт — один executemany в одной транзакции: строки берутся из итератора по
+# мере вставки, файл целиком в память не читается.
+async def import_courses(rows):
+    async with pool.writer() as db:
+        changed = await course_repo.executemany(db, "import", rows)
+    await course_cache.refresh()
+    return changed
+
+async def import_users(rows):
+    # Записи на несуществующий курс, повторы и чужие email пропускаются
+    async with pool.writer() as db:
+        await db.execute("BEGIN IMMEDIATE")
+        added = await user_repo.executemany(db, "import", rows)
+    await seat_counter.reconcile()
+    return added
+
+EXPORTS = {
+    "courses": (course_repo, ("code", "name")),
+    "users": (user_repo, ("id", "course", "name", "telegram_id", "email", "status")),
+}
+
+async def export_rows(table, chunk=500):
+    repo, _ = EXPORTS[table]
+    async for row in repo.stream("export", chunk=chunk):
+        yield row
 
 async def get_registered_courses(telegram_id):
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT course FROM users WHERE telegram_id = ?", (telegram_id,)) as cursor:
-            return [row[0] for row in await cursor.fetchall()]
+    return [row[0] for row in await user_repo.fetchall("registered_courses", (telegram_id,))]
 
 async def add_user(course, name, telegram_id, email):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "INSERT INTO users (course, name, telegram_id, email) VALUES (?, ?, ?, ?)",
-            (course, name, telegram_id, email)
-        )
-        await db.commit()
+    params = {"course": course, "name": name, "telegram_id": telegram_id, "email": email}
+    try:
+        row = await registrations.submit(params)
+    except sqlite3.IntegrityError:
+        return ALREADY_REGISTERED
+    if row is None:
+        return EMAIL_TAKEN
+    if row[1] == WAITLISTED:
+        return WAITLISTED
+    seat_counter.taken(course)
+    return REGISTERED
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+DEDUP_SIZE = int(os.getenv("INGEST_DEDUP_SIZE", 10000))
+DEDUP_PERSIST = os.getenv("DEDUP_PERSIST", "0") == "1"
+DEDUP_FLUSH_INTERVAL = float(os.getenv("DEDUP_FLUSH_INTERVAL", 1.0))
+
+
+# --- Окно недавних update_id ---
+# Кольцевой буфер фиксированного размера задаёт порядок вытеснения, множество
+# даёт проверку за O(1). Telegram повторяет апдейт, если webhook не ответил
+# вовремя, — повтор отбрасывается на входе, до обработчиков и базы.
+class UpdateDedup:
+    def __init__(self, size=DEDUP_SIZE):
+        self.size = size
+        self.dropped = 0
+        self._ring = [None] * size
+        self._position = 0
+        self._ids = set()
+        self._unsaved = []
+        self._task = None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _remember(self, update_id):
+        evicted = self._ring[self._position]
+        if evicted is not None:
+            self._ids.discard(evicted)
+        self._ring[self._position] = update_id
+        self._position = (self._position + 1) % self.size
+        self._ids.add(update_id)
+
+    def seen(self, update_id):
+        if update_id in self._ids:
+            self.dropped += 1
+            return True
+        self._remember(update_id)
+        if self._task is not None:
+            self._unsaved.append((update_id,))
+        return False
+
+    # --- Сохранение в SQLite ---
+    # Новые id пишутся пачкой раз в DEDUP_FLUSH_INTERVAL, таблица обрезается до
+    # размера окна. При падении теряются id только за последний интервал.
+    async def load(self):
+        rows = await _repo().fetchall("recent", (self.size,))
+        for (update_id,) in reversed(rows):
+            if update_id not in self._ids:
+                self._remember(update_id)
+        return len(rows)
+
+    async def start(self):
+        if self._task is None:
+            restored = await self.load()
+            logger.info(f"Окно дедупликации восстановлено: {restored} update_id")
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await self.flush()
+
+    async def flush(self):
+        if not self._unsaved:
+            return
+        rows, self._unsaved = self._unsaved, []
+        repo = _repo()
+        async with repo.pool.writer() as db:
+            await db.execute("BEGIN IMMEDIATE")
+            await repo.executemany(db, "add", rows)
+            await repo.execute(db, "trim", (self.size - 1,))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(DEDUP_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Не удалось сохранить окно дедупликации: {e}", exc_info=True)
+
+
+_dedup_repo = None
+
+
+def _repo():
+    # db (и aiosqlite) импортируется только при включённом сохранении
+    global _dedup_repo
+    if _dedup_repo is None:
+        from db import pool
+        from repos import DedupRepo
+        _dedup_repo = DedupRepo(pool)
+    return _dedup_repo
+
+
+update_dedup = UpdateDedup()
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+MX_CHECK = os.getenv("EMAIL_MX_CHECK", "1") == "1"
+DNS_TIMEOUT = float(os.getenv("EMAIL_DNS_TIMEOUT", 1.0))
+DNS_SERVERS = [server for server in os.getenv("EMAIL_DNS_SERVERS", "").split(",") if server]
+MX_CACHE_SIZE = int(os.getenv("EMAIL_MX_CACHE_SIZE", 4096))
+MX_CACHE_TTL = float(os.getenv("EMAIL_MX_CACHE_TTL", 3600))
+MX_NEGATIVE_TTL = float(os.getenv("EMAIL_MX_NEGATIVE_TTL", 300))
+
+VALID, INVALID_SYNTAX, NO_MX = "valid", "invalid_syntax", "no_mx"
+
+# dot-atom из RFC 5322 без кавычек и комментариев — их на практике не встретить
+LOCAL_RE = re.compile(r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(?:\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*")
+LABEL_RE = re.compile(r"(?!-)[a-z0-9-]{1,63}(?<!-)")
+
+_LOOKUPS = {
+    result: metrics.EMAIL_MX_LOOKUPS.labels(result)
+    for result in ("cached", "found", "not_found", "timeout", "error")
+}
+
+
+# --- Синтаксис и нормализация ---
+# Домен приводится к нижнему регистру и punycode (IDNA), локальная часть не
+# меняется. Возвращает нормализованный адрес или None.
+def normalize(email):
+    email = email.strip()
+    local, sep, domain = email.rpartition("@")
+    if not sep or not local or len(local) > 64 or not LOCAL_RE.fullmatch(local):
+        return None
+    try:
+        domain = domain.rstrip(".").encode("idna").decode("ascii").lower()
+    except UnicodeError:
+        return None
+    labels = domain.split(".")
+    if len(labels) < 2 or len(domain) > 253 or not all(LABEL_RE.fullmatch(label) for label in labels):
+        return None
+    if labels[-1].isdigit():
+        return None
+    email = f"{local}@{domain}"
+    return email if len(email) <= 254 else None
+
+
+# --- Резолверы ---
+# Любой объект с async mx(domain) -> список MX-хостов ([] — почту домен не принимает).
+class AiodnsResolver:
+    def __init__(self, nameservers=None):
+        import aiodns
+
+        self._aiodns = aiodns
+        self._error = aiodns.error
+        self.nameservers = nameservers or None
+        self._resolver = None
+
+    async def mx(self, domain):
+        if self._resolver is None:
+            # c-ares привязывается к текущему event loop — создаём внутри него
+            self._resolver = self._aiodns.DNSResolver(nameservers=self.nameservers)
+        try:
+            hosts = await self._query(domain, "MX", "exchange")
+        except self._error.DNSError as e:
+            if e.args[0] == self._error.ARES_ENOTFOUND:
+                return []
+            if e.args[0] != self._error.ARES_ENODATA:
+                raise
+            hosts = None
+        if hosts is None:
+            # MX нет — по RFC 5321 почта идёт на A-запись домена
+            try:
+                addrs = await self._query(domain, "A", "addr")
+            except self._error.DNSError as e:
+                if e.args[0] in (self._error.ARES_ENOTFOUND, self._error.ARES_ENODATA):
+                    return []
+                raise
+            return [domain] if addrs else []
+        # Null MX (RFC 7505): «.» означает, что домен почту не принимает
+        return [host for host in hosts if host]
+
+    async def _query(self, domain, qtype, field):
+        # В ответе могут быть и CNAME — берём только записи запрошенного типа; None — таких нет
+        result = await self._resolver.query_dns(domain, qtype)
+        values = [
+            getattr(record.data, field).rstrip(".") for record in result.answer
+            if hasattr(record.data, field)
+        ]
+        return values or None
+
+
+class StubResolver:
+    # Для тестов и локального запуска: ответы из словаря, с искусственной задержкой
+    def __init__(self, records, delay=0.0):
+        self.records = records
+        self.delay = delay
+        self.queries = 0
+
+    async def mx(self, domain):
+        self.queries += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return list(self.records.get(domain, []))
+
+
+def default_resolver():
+    try:
+        return AiodnsResolver(DNS_SERVERS)
+    except ImportError:
+        logger.warning("aiodns не установлен — проверка MX отключена")
+        return None
+
+
+# --- Кэш MX ---
+# LRU с TTL: популярные домены резолвятся один раз, отрицательные ответы живут
+# меньше. Одновременные запросы одного домена ждут один и тот же lookup.
+class MXCache:
+    def __init__(self, maxsize=MX_CACHE_SIZE, ttl=MX_CACHE_TTL, negative_ttl=MX_NEGATIVE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, domain):
+        entry = self._entries.get(domain)
+        if entry is None:
+            return None
+        hosts, expires = entry
+        if time.monotonic() >= expires:
+            del self._entries[domain]
+            return None
+        self._entries.move_to_end(domain)
+        return hosts
+
+    def put(self, domain, hosts):
+        ttl = self.ttl if hosts else self.negative_ttl
+        self._entries[domain] = (hosts, time.monotonic() + ttl)
+        self._entries.move_to_end(domain)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def lookup(self, domain, resolver, timeout=DNS_TIMEOUT):
+        # None — ответа нет (таймаут, ошибка DNS): вызывающий пропускает адрес
+        hosts = self.get(domain)
+        if hosts is not None:
+            _LOOKUPS["cached"].inc()
+            return hosts
+        task = self._pending.get(domain)
+        if task is None:
+            task = self._pending[domain] = asyncio.ensure_future(resolver.mx(domain))
+            task.add_done_callback(lambda done: self._resolved(domain, done))
+        try:
+            # shield: таймаут одного ожидающего не отменяет общий запрос
+            hosts = await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            _LOOKUPS["timeout"].inc()
+            logger.warning(f"MX-запрос для {domain} не уложился в {timeout} с, адрес принят без проверки")
+            return None
+        except Exception as e:
+            _LOOKUPS["error"].inc()
+            logger.warning(f"Ошибка MX-запроса для {domain}: {e}")
+            return None
+        _LOOKUPS["found" if hosts else "not_found"].inc()
+        return hosts
+
+    def _resolved(self, domain, task):
+        # Ответ кэшируется, даже если все ожидающие уже ушли по таймауту
+        self._pending.pop(domain, None)
+        if not task.cancelled() and task.exception() is None:
+            self.put(domain, task.result())
+
+
+mx_cache = MXCache()
+resolver = default_resolver() if MX_CHECK else None
+
+
+async def validate_email(email):
+    normalized = normalize(email)
+    if normalized is None:
+        return INVALID_SYNTAX, email
+    if resolver is None:
+        return VALID, normalized
+    hosts = await mx_cache.lookup(normalized.rpartition("@")[2], resolver)
+    if hosts == []:
+        return NO_MX, normalized
+    return VALID, normalized
@@ -1,37 +1,67 @@
-import smtplib
+import os
 from email.message import EmailMessage
 import logging
-from config import SMTP_SERVER, SMTP_PORT, SMTP_USER, SMTP_PASSWORD, FROM_EMAIL
+from config import SMTP_SERVER, SMTP_PORT, SMTP_USER, SMTP_PASSWORD, FROM_EMAIL, smtp_configured
 from db import get_courses
-import asyncio
+from mailer import MailQueue
+from outbox import OutboxDispatcher
 
 logger = logging.getLogger(__name__)
 
-def smtp_configured():
-    return all([SMTP_SERVER, SMTP_PORT, SMTP_USER, SMTP_PASSWORD, FROM_EMAIL])
+mail_queue = MailQueue(
+    SMTP_SERVER, SMTP_PORT or 587, SMTP_USER, SMTP_PASSWORD,
+    starttls=os.getenv("SMTP_STARTTLS", "1") == "1",
+    workers=int(os.getenv("SMTP_WORKERS", 1)),
+)
 
-async def send_confirmation_email(to_email, course_code):
+async def start_mail_queue():
+    if smtp_configured():
+        await mail_queue.start()
+        outbox_dispatcher.start()
+
+async def stop_mail_queue():
+    await outbox_dispatcher.stop()
+    await mail_queue.stop()
+
+async def build_confirmation_email(to_email, course_code):
     COURSES = await get_courses()
     course_name = COURSES.get(course_code, course_code)
 
-    if not smtp_configured():
-        logger.warning("SMTP настройки не полностью заданы")
-        return
-
     msg = EmailMessage()
     msg.set_content(f"""
 🎉 Поздравляем с регистрацией на курс {course_name}!
+Мы рады приветствовать вас в нашей школе программирования.
 Ваша регистрация успешно подтверждена.
+С уважением,
+Команда школы программирования
 """)
     msg['Subject'] = f"✅ Подтверждение регистрации на курс {course_name}"
     msg['From'] = FROM_EMAIL
     msg['To'] = to_email
+    return msg
+
+async def build_reminder_email(to_email, course_code):
+    from reminders import format_start, get_course_start
+
+    COURSES = await get_courses()
+    course_name = COURSES.get(course_code, course_code)
+    starts_at = await get_course_start(course_code)
+    when = f" {format_start(starts_at)}" if starts_at else " скоро"
+
+    msg = EmailMessage()
+    msg.set_content(f"""
+⏰ Напоминаем: курс {course_name} начинается{when}.
+До встречи на занятиях!
+С уважением,
+Команда школы программирования
+""")
+    msg['Subject'] = f"⏰ Скоро старт курса {course_name}"
+    msg['From'] = FROM_EMAIL
+    msg['To'] = to_email
+    return msg
 
-    try:
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USER, SMTP_PASSWORD)
-            server.send_message(msg)
-        logger.info(f"Отправлено подтверждение на email: {to_email}")
-    except Exception as e:
-        logger.error(f"Ошибка при отправке email: {e}", exc_info=True)
+# Письма берутся из email_outbox; process_email и напоминания только будят диспетчер
+outbox_dispatcher = OutboxDispatcher(mail_queue, {
+    "confirmation": build_confirmation_email,
+    "reminder": build_reminder_email,
+})
@@ -1,13 +1,345 @@
+import csv
+import datetime as dt
+import os
+import tempfile
+
+import aiosqlite
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ContextTypes, ConversationHandler, CallbackQueryHandler
-from decorators import admin_only
+from telegram.ext import ContextTypes, ConversationHandler, CallbackQueryHandler, CommandHandler, MessageHandler, filters
+from decorators import require_role
+from db import MAX_CODE_LENGTH, add_course, rename_course, delete_course, get_courses, get_capacity, set_capacity, valid_code
+from handlers.common import cancel_handler
+from sweeper import CONV_TIMEOUT, sweeper
+from roles import VIEWER, COURSE_MANAGER, OWNER, ROLES, get_role, has_role, role_cache, grant_role, revoke_role
 
-ADMIN_MENU, ADMIN_ADD_CODE, ADMIN_ADD_NAME = range(3)
+(
+    ADMIN_MENU, ADMIN_ADD_CODE, ADMIN_ADD_NAME, ADMIN_BROADCAST_TEXT,
+    ADMIN_RENAME_CODE, ADMIN_RENAME_NAME, ADMIN_DELETE_CODE, ADMIN_IMPORT, ADMIN_EXPORT,
+    ADMIN_CAPACITY, ADMIN_START
+) = range(11)
 
-@admin_only
+@require_role(VIEWER)
 async def admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    keyboard = [
-        [InlineKeyboardButton("Добавить курс", callback_data="add_course")]
-    ]
+    # Кнопки показываются по правам; сами обработчики проверяют роль ещё раз
+    role = await get_role(update.effective_user.id)
+    keyboard = []
+    if has_role(role, COURSE_MANAGER):
+        keyboard += [
+            [InlineKeyboardButton("Добавить курс", callback_data="add_course")],
+            [
+                InlineKeyboardButton("✏️ Переименовать", callback_data="rename_course"),
+                InlineKeyboardButton("🗑 Удалить", callback_data="delete_course")
+            ],
+            [
+                InlineKeyboardButton("🎟 Места", callback_data="capacity"),
+                InlineKeyboardButton("📅 Старт", callback_data="start_date")
+            ],
+            [InlineKeyboardButton("📥 Импорт", callback_data="import")]
+        ]
+    keyboard.append([InlineKeyboardButton("📤 Экспорт", callback_data="export")])
+    if has_role(role, OWNER):
+        keyboard.append([InlineKeyboardButton("📣 Рассылка", callback_data="broadcast")])
     await update.message.reply_text("Меню администратора:", reply_markup=InlineKeyboardMarkup(keyboard))
     return ADMIN_MENU
+
+@require_role(COURSE_MANAGER)
+async def admin_add_course(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    await query.edit_message_text("Введите код курса (латиница, без пробелов):")
+    return ADMIN_ADD_CODE
+
+@require_role(COURSE_MANAGER)
+async def admin_add_code(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    code = update.message.text.strip().lower()
+    if not valid_code(code):
+        await update.message.reply_text(f"❌ Код должен состоять из латинских букв и цифр, не длиннее {MAX_CODE_LENGTH}")
+        return ADMIN_ADD_CODE
+    context.user_data['new_course_code'] = code
+    await update.message.reply_text("Введите название курса:")
+    return ADMIN_ADD_NAME
+
+@require_role(COURSE_MANAGER)
+async def admin_add_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    name = update.message.text.strip()
+    code = context.user_data.pop('new_course_code')
+    try:
+        await add_course(code, name)
+    except aiosqlite.IntegrityError:
+        await update.message.reply_text(f"❌ Курс с кодом {code} уже существует")
+        return ConversationHandler.END
+    await update.message.reply_text(f"✅ Курс {name} добавлен")
+    return ConversationHandler.END
+
+# --- Переименование и удаление ---
+async def _course_list():
+    courses = await get_courses()
+    return "\n".join(f"{code} — {name}" for code, name in courses.items()) or "Каталог пуст"
+
+@require_role(COURSE_MANAGER)
+async def admin_rename_course(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    await query.edit_message_text(f"{await _course_list()}\n\nВведите код курса для переименования:")
+    return ADMIN_RENAME_CODE
+
+@require_role(COURSE_MANAGER)
+async def admin_rename_code(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    code = update.message.text.strip().lower()
+    if code not in await get_courses():
+        await update.message.reply_text(f"❌ Курса с кодом {code} нет, введите другой код:")
+        return ADMIN_RENAME_CODE
+    context.user_data['rename_course_code'] = code
+    await update.message.reply_text("Введите новое название курса:")
+    return ADMIN_RENAME_NAME
+
+@require_role(COURSE_MANAGER)
+async def admin_rename_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    name = update.message.text.strip()
+    code = context.user_data.pop('rename_course_code')
+    if await rename_course(code, name):
+        await update.message.reply_text(f"✅ Курс {code} переименован в «{name}»")
+    else:
+        await update.message.reply_text(f"❌ Курс {code} не найден")
+    return ConversationHandler.END
+
+@require_role(COURSE_MANAGER)
+async def admin_delete_course(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    await query.edit_message_text(f"{await _course_list()}\n\nВведите код курса для удаления:")
+    return ADMIN_DELETE_CODE
+
+@require_role(COURSE_MANAGER)
+async def admin_delete_code(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    code = update.message.text.strip().lower()
+    if code not in await get_courses():
+        await update.message.reply_text(f"❌ Курса с кодом {code} нет")
+        return ConversationHandler.END
+    registered = await delete_course(code)
+    if registered:
+        await update.message.reply_text(f"❌ На курс {code} записано {registered} чел., удаление невозможно")
+    else:
+        await update.message.reply_text(f"✅ Курс {code} удалён")
+    return ConversationHandler.END
+
+# --- Места на курсе ---
+@require_role(COURSE_MANAGER)
+async def admin_capacity(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    await query.edit_message_text(
+        f"{await _course_list()}\n\nВведите код курса и число мест, например «react 30»; "
+        "«react -» снимает ограничение:"
+    )
+    return ADMIN_CAPACITY
+
+@require_role(COURSE_MANAGER)
+async def admin_capacity_set(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    from handlers.enrollment import notify_promoted
+
+    parts = update.message.text.split()
+    if len(parts) != 2 or not (parts[1] == "-" or parts[1].isdigit()):
+        await update.message.reply_text("❌ Формат: <код> <число мест> или <код> -")
+        return ADMIN_CAPACITY
+    code, capacity = parts[0].lower(), None if parts[1] == "-" else int(parts[1])
+    promoted = await set_capacity(code, capacity)
+    if promoted is None:
+        await update.message.reply_text(f"❌ Курса с кодом {code} нет")
+        return ConversationHandler.END
+    _, enrolled, waitlisted = await get_capacity(code)
+    limit = "без ограничения" if capacity is None else f"{capacity} мест"
+    await update.message.reply_text(
+        f"✅ Курс {code}: {limit}, записано {enrolled}, в листе ожидания {waitlisted}, "
+        f"переведено из листа ожидания {len(promoted)}"
+    )
+    context.application.create_task(notify_promoted(context.bot, code, promoted))
+    return ConversationHandler.END
+
+# --- Дата старта и напоминания ---
+@require_role(COURSE_MANAGER)
+async def admin_course_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    await query.edit_message_text(
+        f"{await _course_list()}\n\nВведите код курса и дату старта, например «react 2025-03-01 19:00»; "
+        "«react -» снимает дату и напоминания:"
+    )
+    return ADMIN_START
+
+@require_role(COURSE_MANAGER)
+async def admin_course_start_set(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    from reminders import format_start, scheduler, set_course_start
+
+    code, _, value = update.message.text.strip().partition(" ")
+    code, value = code.lower(), value.strip()
+    try:
+        starts_at = None if value == "-" else dt.datetime.strptime(value, "%Y-%m-%d %H:%M").timestamp()
+    except ValueError:
+        await update.message.reply_text("❌ Формат: <код> ГГГГ-ММ-ДД ЧЧ:ММ или <код> -")
+        return ADMIN_START
+    if not await set_course_start(code, starts_at):
+        await update.message.reply_text(f"❌ Курса с кодом {code} нет")
+        return ConversationHandler.END
+    # Близкие напоминания сразу в JobQueue, не дожидаясь очередной подгрузки
+    if context.job_queue is not None:
+        await scheduler.load(context.job_queue)
+    if starts_at is None:
+        await update.message.reply_text(f"✅ Дата старта курса {code} снята, напоминания отменены")
+    else:
+        await update.message.reply_text(f"✅ Курс {code} стартует {format_start(starts_at)}, напоминания запланированы")
+    return ConversationHandler.END
+
+# --- Импорт и экспорт ---
+@require_role(COURSE_MANAGER)
+async def admin_import(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    await query.edit_message_text(
+        "Отправьте файл courses.csv/json или users.csv/json.\n"
+        "Колонки курсов: code, name; пользователей: course, name, telegram_id, email"
+    )
+    return ADMIN_IMPORT
+
+@require_role(COURSE_MANAGER)
+async def admin_import_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    import bulk
+
+    document = update.message.document
+    detected = bulk.detect(document.file_name or "")
+    if detected is None:
+        await update.message.reply_text("❌ Имя файла должно начинаться с courses или users, формат — csv или json")
+        return ADMIN_IMPORT
+    table, fmt = detected
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        file = await document.get_file()
+        await file.download_to_drive(path)
+        changed, skipped = await bulk.import_file(path, table, fmt)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        await update.message.reply_text(f"❌ Не удалось разобрать файл: {e}")
+        return ConversationHandler.END
+    finally:
+        os.remove(path)
+    await update.message.reply_text(f"✅ Импорт {table}: записано {changed}, пропущено некорректных строк {skipped}")
+    return ConversationHandler.END
+
+@require_role(VIEWER)
+async def admin_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    keyboard = [
+        [InlineKeyboardButton(f"{table}.{fmt}", callback_data=f"export_{table}_{fmt}") for fmt in ("csv", "json")]
+        for table in ("courses", "users")
+    ]
+    await query.edit_message_text("Что выгрузить?", reply_markup=InlineKeyboardMarkup(keyboard))
+    return ADMIN_EXPORT
+
+@require_role(VIEWER)
+async def admin_export_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    import bulk
+
+    query = update.callback_query
+    await query.answer()
+    _, table, fmt = query.data.split("_")
+    await query.edit_message_text(f"⏳ Выгружаю {table}.{fmt}…")
+    path, count = await bulk.export_file(table, fmt)
+    try:
+        with open(path, "rb") as f:
+            await context.bot.send_document(
+                update.effective_chat.id, f, filename=f"{table}.{fmt}", caption=f"Строк: {count}"
+            )
+    finally:
+        os.remove(path)
+    return ConversationHandler.END
+
+# --- Рассылка ---
+@require_role(OWNER)
+async def admin_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    await query.edit_message_text("Введите текст рассылки для всех зарегистрированных пользователей:")
+    return ADMIN_BROADCAST_TEXT
+
+@require_role(OWNER)
+async def admin_broadcast_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    from broadcast import create_broadcast, start_broadcast
+    broadcast_id = await create_broadcast(update.message.text)
+    start_broadcast(context.bot, broadcast_id, notify_chat_id=update.effective_chat.id)
+    await update.message.reply_text(f"📣 Рассылка #{broadcast_id} запущена")
+    return ConversationHandler.END
+
+# --- Управление ролями ---
+@require_role(OWNER)
+async def admin_grant(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if len(context.args) != 2 or not context.args[0].lstrip("-").isdigit() or context.args[1] not in ROLES:
+        await update.message.reply_text(f"Использование: /grant <telegram_id> <{'|'.join(ROLES)}>")
+        return
+    telegram_id, role = int(context.args[0]), context.args[1]
+    if telegram_id == update.effective_user.id:
+        await update.message.reply_text("❌ Нельзя менять собственную роль")
+        return
+    await grant_role(telegram_id, role, added_by=update.effective_user.id)
+    await update.message.reply_text(f"✅ Пользователю {telegram_id} выдана роль {role}")
+
+@require_role(OWNER)
+async def admin_revoke(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if len(context.args) != 1 or not context.args[0].lstrip("-").isdigit():
+        await update.message.reply_text("Использование: /revoke <telegram_id>")
+        return
+    telegram_id = int(context.args[0])
+    if telegram_id == update.effective_user.id:
+        await update.message.reply_text("❌ Нельзя снять роль с самого себя")
+        return
+    if await revoke_role(telegram_id):
+        await update.message.reply_text(f"✅ У пользователя {telegram_id} больше нет доступа")
+    else:
+        await update.message.reply_text(f"❌ У пользователя {telegram_id} не было роли")
+
+@require_role(OWNER)
+async def admin_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    roles = await role_cache.all()
+    lines = [f"{telegram_id} — {role}" for telegram_id, role in sorted(roles.items(), key=lambda item: item[1])]
+    await update.message.reply_text("\n".join(lines) or "Список пуст")
+
+role_handlers = [
+    CommandHandler("grant", admin_grant),
+    CommandHandler("revoke", admin_revoke),
+    CommandHandler("admins", admin_list),
+]
+
+admin_conv_handler = ConversationHandler(
+    entry_points=[CommandHandler("admin", admin_menu)],
+    states={
+        ADMIN_MENU: [
+            CallbackQueryHandler(admin_add_course, pattern=r'^add_course$'),
+            CallbackQueryHandler(admin_rename_course, pattern=r'^rename_course$'),
+            CallbackQueryHandler(admin_delete_course, pattern=r'^delete_course$'),
+            CallbackQueryHandler(admin_capacity, pattern=r'^capacity$'),
+            CallbackQueryHandler(admin_course_start, pattern=r'^start_date$'),
+            CallbackQueryHandler(admin_import, pattern=r'^import$'),
+            CallbackQueryHandler(admin_export, pattern=r'^export$'),
+            CallbackQueryHandler(admin_broadcast, pattern=r'^broadcast$')
+        ],
+        ADMIN_ADD_CODE: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_add_code)],
+        ADMIN_ADD_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_add_name)],
+        ADMIN_RENAME_CODE: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_rename_code)],
+        ADMIN_RENAME_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_rename_name)],
+        ADMIN_DELETE_CODE: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_delete_code)],
+        ADMIN_CAPACITY: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_capacity_set)],
+        ADMIN_START: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_course_start_set)],
+        ADMIN_IMPORT: [MessageHandler(filters.Document.ALL, admin_import_file)],
+        ADMIN_EXPORT: [CallbackQueryHandler(admin_export_file, pattern=r'^export_(courses|users)_(csv|json)$')],
+        ADMIN_BROADCAST_TEXT: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_broadcast_text)],
+    },
+    fallbacks=[cancel_handler],
+    name="admin",
+    persistent=True
+)
+# У админки один таймаут на все шаги
+sweeper.track(
+    admin_conv_handler,
+    dict.fromkeys(admin_conv_handler.states, float(os.getenv("ADMIN_TIMEOUT", CONV_TIMEOUT))),
+    user_data_keys=("new_course_code", "rename_course_code"),
+)
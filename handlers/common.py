@@ -0,0 +1,10 @@
+from telegram import Update
+from telegram.ext import ContextTypes, CommandHandler, ConversationHandler
+from sweeper import sweeper
+
+async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    sweeper.clear_user_data(context.user_data)
+    await update.message.reply_text("❎ Действие отменено")
+    return ConversationHandler.END
+
+cancel_handler = CommandHandler("cancel", cancel)
@@ -0,0 +1,51 @@
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler
+from db import get_courses, get_registered_courses, cancel_registration
+from metrics import instrument
+
+LEAVE_PREFIX = "leave_"
+
+# --- Перевод из листа ожидания ---
+# Запись в outbox сделана той же транзакцией, что и перевод; здесь — только
+# сообщение в Telegram и пробуждение отправки писем
+async def notify_promoted(bot, course_code, telegram_ids):
+    if not telegram_ids:
+        return
+    from broadcast import default_throttle, send_throttled
+    from emails_utils import outbox_dispatcher
+    outbox_dispatcher.notify()
+    course = (await get_courses()).get(course_code, course_code)
+    for telegram_id in telegram_ids:
+        await send_throttled(bot, default_throttle, telegram_id, f"🎉 Освободилось место — вы записаны на курс {course}!")
+
+# --- Отмена записи ---
+@instrument("leave")
+async def leave(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    registered = await get_registered_courses(update.effective_user.id)
+    if not registered:
+        await update.message.reply_text("Вы не записаны ни на один курс")
+        return
+    courses = await get_courses()
+    keyboard = [
+        [InlineKeyboardButton(text=f"❌ {courses.get(code, code)}", callback_data=f"{LEAVE_PREFIX}{code}")]
+        for code in registered
+    ]
+    await update.message.reply_text("Выберите курс, запись на который нужно отменить:",
+                                    reply_markup=InlineKeyboardMarkup(keyboard))
+
+@instrument("leave_course")
+async def leave_course(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    course_code = query.data[len(LEAVE_PREFIX):]
+    promoted = await cancel_registration(query.from_user.id, course_code)
+    if promoted is None:
+        await query.edit_message_text("❌ Запись на этот курс не найдена")
+        return
+    await query.edit_message_text("✅ Запись отменена")
+    context.application.create_task(notify_promoted(context.bot, course_code, promoted))
+
+leave_handlers = [
+    CommandHandler("leave", leave),
+    CallbackQueryHandler(leave_course, pattern=rf'^{LEAVE_PREFIX}\w+$'),
+]
@@ -1,17 +1,33 @@
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
-from telegram.ext import ContextTypes, CallbackQueryHandler, MessageHandler, filters, ConversationHandler
-from db import get_courses, get_registered_courses, add_user
-from email_utils import send_confirmation_email
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ConversationHandler
+from config import WEBAPP_URL
+from keyboards import course_keyboard, parse_page, PAGE_PREFIX
+from metrics import instrument
+from db import get_courses, get_registered_courses, add_user, seat_counter, EMAIL_TAKEN, ALREADY_REGISTERED, WAITLISTED
+from email_validation import validate_email, INVALID_SYNTAX, NO_MX
+from handlers.common import cancel_handler
+from sweeper import state_timeouts, sweeper
 
 COURSE, NAME, CONFIRM, EMAIL = range(4)
 
+# Таймауты шагов: REG_TIMEOUT_COURSE, REG_TIMEOUT_NAME, ... (секунды)
+STATE_TIMEOUTS = state_timeouts("REG_TIMEOUT", {"COURSE": COURSE, "NAME": NAME, "CONFIRM": CONFIRM, "EMAIL": EMAIL})
+
+@instrument("start")
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    COURSES = await get_courses()
-    buttons = [[InlineKeyboardButton(text=name, callback_data=f"course_{code}")] for code, name in COURSES.items()]
-    keyboard = InlineKeyboardMarkup(buttons)
-    await update.message.reply_text("Выберите курс:", reply_markup=keyboard)
+    keyboard = await course_keyboard(webapp_url=WEBAPP_URL)
+    await update.message.reply_text("👋 Добро пожаловать в нашу школу программирования!\nВыберите курс:", reply_markup=keyboard)
+    return COURSE
+
+@instrument("change_page")
+async def change_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    keyboard = await course_keyboard(parse_page(query.data), webapp_url=WEBAPP_URL)
+    await query.edit_message_reply_markup(reply_markup=keyboard)
     return COURSE
 
+@instrument("process_course")
 async def process_course(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -26,20 +42,86 @@ async def process_course(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.answer(f"⚠️ Вы уже зарегистрированы на {COURSES[course_code]}", show_alert=True)
         return COURSE
     context.user_data['course'] = course_code
-    await query.edit_message_text(f"Вы выбрали курс {COURSES[course_code]}. Введите имя:")
+    # Счётчик в памяти может отставать; окончательно место резервирует запись в БД
+    note = "\n⏳ Свободных мест нет — вы попадёте в лист ожидания" if await seat_counter.remaining(course_code) == 0 else ""
+    await query.edit_message_text(f"📘 Вы выбрали курс: {COURSES[course_code]}{note}\nВведите своё имя:")
     return NAME
 
+@instrument("process_name")
 async def process_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     name = update.message.text.strip()
+    if len(name) < 2 or len(name) > 50:
+        await update.message.reply_text("❌ Имя должно быть от 2 до 50 символов")
+        return NAME
     context.user_data['name'] = name
-    await update.message.reply_text("Введите email:")
+    COURSES = await get_courses()
+    course_code = context.user_data['course']
+    await update.message.reply_text(
+        f"Вы ввели имя: {name}\n🔹 Курс: {COURSES[course_code]}\n\n✅ Подтвердите ввод",
+        reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton(text="🔄 Изменить имя", callback_data="edit_name")],
+            [InlineKeyboardButton(text="➡️ Продолжить", callback_data="confirm_name")]
+        ])
+    )
+    return CONFIRM
+
+@instrument("edit_name")
+async def edit_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.edit_message_text("Введите новое имя:")
+    return NAME
+
+@instrument("confirm_name")
+async def confirm_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.edit_message_text("📧 Введите свой email для регистрации:")
     return EMAIL
 
+@instrument("process_email")
 async def process_email(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    email = update.message.text.strip()
+    status, email = await validate_email(update.message.text)
+    if status == INVALID_SYNTAX:
+        await update.message.reply_text("❌ Неверный формат email")
+        return EMAIL
+    if status == NO_MX:
+        await update.message.reply_text(f"❌ Домен {email.rpartition('@')[2]} не принимает почту, проверьте адрес")
+        return EMAIL
     data = context.user_data
     telegram_id = update.message.from_user.id
-    await add_user(data['course'], data['name'], telegram_id, email)
-    await send_confirmation_email(email, data['course'])
+    status = await add_user(data['course'], data['name'], telegram_id, email)
+    if status == EMAIL_TAKEN:
+        await update.message.reply_text("❌ Эта почта уже используется другим пользователем")
+        return EMAIL
+    if status == ALREADY_REGISTERED:
+        sweeper.clear_user_data(data)
+        await update.message.reply_text("❌ Вы уже зарегистрированы на этот курс")
+        return ConversationHandler.END
+    sweeper.clear_user_data(data)
+    if status == WAITLISTED:
+        await update.message.reply_text("⏳ Мест на курсе нет, вы в листе ожидания. Как только место освободится, "
+                                        "мы запишем вас автоматически и пришлём письмо")
+        return ConversationHandler.END
     await update.message.reply_text("✅ Регистрация успешна!")
+    # Письмо уже лежит в email_outbox (той же транзакцией, что и запись);
+    # почтовый модуль импортируется при первой регистрации
+    from emails_utils import outbox_dispatcher
+    outbox_dispatcher.notify()
     return ConversationHandler.END
+
+registration_conv_handler = ConversationHandler(
+    entry_points=[CommandHandler("start", start)],
+    states={
+        COURSE: [
+            CallbackQueryHandler(process_course, pattern=r'^course_'),
+            CallbackQueryHandler(change_page, pattern=rf'^{PAGE_PREFIX}\d+$')
+        ],
+        NAME: [
+            MessageHandler(filters.TEXT & ~filters.COMMAND, process_name),
+            CallbackQueryHandler(edit_name, pattern="edit_name")
+        ],
+        CONFIRM: [CallbackQueryHandler(confirm_name, pattern="confirm_name")],
+        EMAIL: [MessageHandler(filters.TEXT & ~filters.COMMAND, process_email)],
+    },
+    fallbacks=[cancel_handler],
+    name="registration",
+    persistent=True
+)
+sweeper.track(registration_conv_handler, STATE_TIMEOUTS, user_data_keys=("course", "name"))
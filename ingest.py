@@ -0,0 +1,65 @@
+import json
+import os
+
+import metrics
+from dedup import update_dedup
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Виды апдейтов, которые есть кому обработать; остальное отбрасывается до
+# построения объектов PTB
+RELEVANT = frozenset(os.getenv("INGEST_RELEVANT", "command,text,callback,document").split(","))
+
+
+# --- Разбор тела запроса ---
+# orjson разбирает bytes напрямую, без промежуточной строки; без него — stdlib.
+# Ошибки разбора в обоих случаях — ValueError.
+loads = orjson.loads if orjson is not None else json.loads
+
+
+# --- Предварительная классификация ---
+# Смотрит только на несколько полей словаря: update_id, callback_query.data,
+# message.text. Повторы (Telegram повторяет апдейт, если не дождался ответа)
+# и апдейты, для которых нет обработчиков, до Update.de_json не доходят.
+def classify(data):
+    callback = data.get("callback_query")
+    if callback is not None:
+        return "callback" if callback.get("data") else None
+    message = data.get("message")
+    if message is None:
+        return None
+    text = message.get("text")
+    if text is not None:
+        return "command" if text.startswith("/") else "text"
+    if "document" in message:
+        return "document"
+    return None
+
+
+_DROPPED = {reason: metrics.INGEST_DROPPED.labels(reason) for reason in ("duplicate", "irrelevant")}
+
+
+class Ingest:
+    def __init__(self, relevant=RELEVANT, dedup=None):
+        self.relevant = relevant
+        self.dedup = dedup if dedup is not None else update_dedup
+        self.accepted = 0
+        self.duplicates = 0
+        self.irrelevant = 0
+
+    def accept(self, data):
+        # Словарь апдейта, если его нужно обработать, иначе None
+        update_id = data.get("update_id")
+        if update_id is not None and self.dedup.seen(update_id):
+            self.duplicates += 1
+            _DROPPED["duplicate"].inc()
+            return None
+        if classify(data) not in self.relevant:
+            self.irrelevant += 1
+            _DROPPED["irrelevant"].inc()
+            return None
+        self.accepted += 1
+        return data
@@ -0,0 +1,55 @@
+import os
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
+
+from db import get_courses
+
+COURSES_PER_PAGE = int(os.getenv("COURSES_PER_PAGE", 8))
+PAGE_PREFIX = "page_"
+
+# --- Клавиатура выбора курса ---
+# Страницы строятся один раз из кэша курсов и переиспользуются. Кэш курсов отдаёт
+# один и тот же объект до следующего обновления, поэтому смена объекта означает,
+# что каталог изменился и готовые клавиатуры нужно выбросить.
+_pages = {}
+_source = None
+
+
+def page_count(courses):
+    return max(1, -(-len(courses) // COURSES_PER_PAGE))
+
+
+def _build_page(courses, page, webapp_url):
+    items = list(courses.items())
+    pages = page_count(courses)
+    chunk = items[page * COURSES_PER_PAGE:(page + 1) * COURSES_PER_PAGE]
+    buttons = [[InlineKeyboardButton(text=name, callback_data=f"course_{code}")] for code, name in chunk]
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"{PAGE_PREFIX}{page - 1}"))
+    if page < pages - 1:
+        navigation.append(InlineKeyboardButton(text=f"Вперёд ▶️ ({page + 2}/{pages})",
+                                               callback_data=f"{PAGE_PREFIX}{page + 1}"))
+    if navigation:
+        buttons.append(navigation)
+    if webapp_url:
+        buttons.append([InlineKeyboardButton(text="📱 Открыть мини-приложение", web_app=WebAppInfo(url=webapp_url))])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+async def course_keyboard(page=0, webapp_url=None):
+    global _source
+    courses = await get_courses()
+    if courses is not _source:
+        _pages.clear()
+        _source = courses
+    page = min(max(page, 0), page_count(courses) - 1)
+    key = (page, webapp_url)
+    markup = _pages.get(key)
+    if markup is None:
+        markup = _pages[key] = _build_page(courses, page, webapp_url)
+    return markup
+
+
+def parse_page(data):
+    return int(data[len(PAGE_PREFIX):])
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import smtplib
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+# --- Очередь исходящей почты ---
+# Обработчики только кладут письмо в ограниченную очередь. Фоновые воркеры держат
+# авторизованную SMTP-сессию открытой и отправляют через неё письма подряд;
+# блокирующий smtplib выполняется в пуле потоков и не останавливает event loop.
+class MailQueue:
+    def __init__(self, host, port, user=None, password=None, *, starttls=True, workers=1,
+                 maxsize=1000, retries=3, backoff=1.0, idle_timeout=60.0, timeout=30.0):
+        self.host = host
+        self.port = int(port)
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.workers = workers
+        self.maxsize = maxsize
+        self.retries = retries
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.sent = 0
+        self.failed = 0
+        self._queue = None
+        self._tasks = []
+
+    @property
+    def depth(self):
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        metrics.EMAIL_QUEUE_DEPTH.set_function(lambda: self.depth)
+
+    async def send(self, msg, wait=False):
+        # С wait=True дожидается отправки и возвращает None или последнюю ошибку
+        future = asyncio.get_running_loop().create_future() if wait else None
+        await self._queue.put((msg, future))
+        if future is not None:
+            return await future
+
+    async def stop(self, timeout=30.0):
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Очередь почты не опустела за {timeout} с, осталось писем: {self.depth}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            server.starttls()
+        if self.user:
+            server.login(self.user, self.password)
+        return server
+
+    @staticmethod
+    def _close(server):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def _deliver(self, server, msg):
+        if server is None:
+            server = self._connect()
+        try:
+            server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # Сервер закрыл простаивавшую сессию — переподключаемся один раз
+            server = self._connect()
+            server.send_message(msg)
+        return server
+
+    async def _worker(self, number):
+        server = None
+        try:
+            while True:
+                try:
+                    msg, future = await asyncio.wait_for(self._queue.get(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    if server is not None:
+                        await asyncio.to_thread(self._close, server)
+                        server = None
+                    continue
+                error = asyncio.CancelledError()
+                try:
+                    server, error = await self._send_with_retry(server, msg)
+                finally:
+                    self._queue.task_done()
+                    if future is not None and not future.done():
+                        future.set_result(error)
+        finally:
+            if server is not None:
+                await asyncio.to_thread(self._close, server)
+
+    async def _send_with_retry(self, server, msg):
+        for attempt in range(self.retries + 1):
+            try:
+                server = await asyncio.to_thread(self._deliver, server, msg)
+                self.sent += 1
+                metrics.EMAILS_SENT.inc()
+                logger.info(f"Отправлено письмо на email: {msg['To']}")
+                return server, None
+            except Exception as e:
+                if server is not None:
+                    await asyncio.to_thread(self._close, server)
+                    server = None
+                if attempt == self.retries:
+                    self.failed += 1
+                    metrics.EMAILS_FAILED.inc()
+                    logger.error(f"Ошибка при отправке email на {msg['To']}: {e}", exc_info=True)
+                    return None, e
+                delay = self.backoff * 2 ** attempt
+                logger.warning(f"Ошибка при отправке email на {msg['To']}, повтор через {delay} с: {e}")
+                await asyncio.sleep(delay)
@@ -0,0 +1,168 @@
+import bisect
+import time
+from functools import wraps
+
+# --- Метрики в формате Prometheus ---
+# Минимальная реализация без внешних зависимостей: счётчики, gauge и гистограммы
+# с метками, текстовая выдача для /metrics. Запись метрики — пара арифметических
+# операций и bisect, на горячем пути это незаметно.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+registry = []
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Value:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        self.function = function
+
+    def get(self):
+        return self.function() if self.function else self.value
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        registry.append(self)
+        if not self.labelnames:
+            self.labels()
+
+    def _new_child(self):
+        return _Value()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def __getattr__(self, item):
+        # Метрики без меток: COUNTER.inc() вместо COUNTER.labels().inc()
+        if item in ("inc", "dec", "set", "set_function", "observe", "get"):
+            return getattr(self.labels(), item)
+        raise AttributeError(item)
+
+    def collect(self):
+        for values, child in self._children.items():
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {child.get()}"
+
+    def render(self):
+        return "\n".join([
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.collect(),
+        ])
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def collect(self):
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.labelnames, values, f'le="{le}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {child.sum}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+def render():
+    return "\n".join(metric.render() for metric in registry) + "\n"
+
+
+HANDLER_LATENCY = Histogram("bot_handler_duration_seconds", "Время работы обработчика", ["handler"])
+HANDLER_IN_PROGRESS = Gauge("bot_handler_in_progress", "Обработчиков выполняется сейчас", ["handler"])
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Исключения в обработчиках", ["handler"])
+WEBHOOK_LATENCY = Histogram("bot_webhook_duration_seconds", "Время приёма апдейта на /webhook", ["status"])
+INGEST_DROPPED = Counter("bot_ingest_dropped_total", "Апдейтов отброшено до разбора в объекты PTB", ["reason"])
+DB_QUERY_LATENCY = Histogram("bot_db_query_duration_seconds", "Время работы с соединением из пула", ["op"])
+DB_SLOW_QUERIES = Counter("bot_db_slow_queries_total", "Запросов дольше DB_SLOW_QUERY_MS", ["query"])
+EMAIL_QUEUE_DEPTH = Gauge("bot_email_queue_depth", "Писем в очереди на отправку")
+EMAILS_SENT = Counter("bot_emails_sent_total", "Отправлено писем")
+EMAILS_FAILED = Counter("bot_emails_failed_total", "Писем не удалось отправить")
+OUTBOX_PENDING = Gauge("bot_email_outbox_pending", "Писем в outbox, ожидающих отправки")
+COURSE_CACHE_HITS = Counter("bot_course_cache_hits_total", "Обращений к кэшу курсов без запроса в БД")
+COURSE_CACHE_MISSES = Counter("bot_course_cache_misses_total", "Обращений к кэшу курсов с загрузкой из БД")
+RATE_LIMITED = Counter("bot_rate_limited_total", "Апдейтов отброшено ограничителем частоты")
+SESSIONS_RECLAIMED = Counter("bot_sessions_reclaimed_total", "Освобождено уборкой брошенных диалогов", ["kind"])
+EMAIL_MX_LOOKUPS = Counter("bot_email_mx_lookups_total", "Проверки MX домена email по результату", ["result"])
+
+
+def instrument(name):
+    def decorator(func):
+        latency = HANDLER_LATENCY.labels(name)
+        in_progress = HANDLER_IN_PROGRESS.labels(name)
+        errors = HANDLER_ERRORS.labels(name)
+
+        @wraps(func)
+        async def wrapper(update, context):
+            in_progress.inc()
+            started = time.perf_counter()
+            try:
+                return await func(update, context)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                latency.observe(time.perf_counter() - started)
+                in_progress.dec()
+        return wrapper
+    return decorator
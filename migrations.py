@@ -0,0 +1,167 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# --- Миграции схемы ---
+# Номер применённой миграции хранится в PRAGMA user_version. Новые миграции
+# только добавляются в конец списка; уже выпущенные не редактируются.
+MIGRATIONS = [
+    # 1: исходная схема
+    (
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            course TEXT,
+            name TEXT,
+            telegram_id INTEGER,
+            email TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS courses (
+            code TEXT PRIMARY KEY,
+            name TEXT
+        )
+        """,
+        "DROP INDEX IF EXISTS idx_email",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_user_email ON users(telegram_id, email)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_user_course ON users(telegram_id, course)",
+        # Дефолтные курсы — только в пустой каталог
+        """
+        INSERT INTO courses (code, name)
+        SELECT * FROM (VALUES
+            ('html', 'HTML & CSS для начинающих'),
+            ('js', 'JavaScript с нуля'),
+            ('react', 'React.js для создания интерфейсов')
+        )
+        WHERE NOT EXISTS (SELECT 1 FROM courses)
+        """,
+    ),
+    # 2: индекс по email для проверки владельца адреса; уникальность (telegram_id, email)
+    # мешала записи одного пользователя на несколько курсов с одной почтой
+    (
+        "DROP INDEX IF EXISTS idx_user_email",
+        "CREATE INDEX IF NOT EXISTS idx_users_email ON users(email, telegram_id)",
+    ),
+    # 3: персистентность PTB — по строке на каждый ключ
+    (
+        """
+        CREATE TABLE IF NOT EXISTS persistence_data (
+            kind TEXT NOT NULL,
+            key INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (kind, key)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS persistence_conversations (
+            name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            state BLOB NOT NULL,
+            PRIMARY KEY (name, key)
+        ) WITHOUT ROWID
+        """,
+    ),
+    # 4: рассылки с сохранением прогресса
+    (
+        """
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            last_telegram_id INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ),
+    # 5: outbox писем с подтверждением, пишется в одной транзакции с users
+    (
+        """
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            email TEXT NOT NULL,
+            course TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            claimed_at REAL,
+            last_error TEXT,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_outbox_status ON email_outbox(status, next_attempt_at)",
+    ),
+    # 6: администраторы и их роли
+    (
+        """
+        CREATE TABLE IF NOT EXISTS admins (
+            telegram_id INTEGER PRIMARY KEY,
+            role TEXT NOT NULL,
+            added_by INTEGER,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ),
+    # 7: недавние update_id для дедупликации между перезапусками
+    (
+        "CREATE TABLE IF NOT EXISTS seen_updates (update_id INTEGER PRIMARY KEY)",
+    ),
+    # 8: места на курсах и лист ожидания (NULL — без ограничения)
+    (
+        "ALTER TABLE courses ADD COLUMN capacity INTEGER",
+        "ALTER TABLE users ADD COLUMN status TEXT NOT NULL DEFAULT 'enrolled'",
+        "CREATE INDEX IF NOT EXISTS idx_users_course_status ON users(course, status, id)",
+    ),
+    # 9: дата старта курса и напоминания о нём; kind — вид письма в outbox
+    (
+        "ALTER TABLE courses ADD COLUMN starts_at REAL",
+        "ALTER TABLE email_outbox ADD COLUMN kind TEXT NOT NULL DEFAULT 'confirmation'",
+        """
+        CREATE TABLE IF NOT EXISTS reminders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            course TEXT NOT NULL,
+            run_at REAL NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            last_user_id INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            claimed_at REAL,
+            UNIQUE (course, run_at)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders(status, run_at)",
+    ),
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+async def get_version(db):
+    async with db.execute("PRAGMA user_version") as cursor:
+        return (await cursor.fetchone())[0]
+
+
+async def migrate(db):
+    version = await get_version(db)
+    if version >= SCHEMA_VERSION:
+        return version
+    for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        # IMMEDIATE сразу берёт блокировку записи: если несколько процессов стартуют
+        # одновременно, миграцию применит первый, остальные увидят новый user_version
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            if await get_version(db) >= number:
+                await db.rollback()
+                continue
+            for sql in statements:
+                await db.execute(sql)
+            await db.execute(f"PRAGMA user_version = {number}")
+        except BaseException:
+            await db.rollback()
+            raise
+        await db.commit()
+        logger.info(f"Применена миграция схемы БД №{number}")
+    return SCHEMA_VERSION
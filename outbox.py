@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import os
+import time
+
+import metrics
+from db import pool
+from repos import OutboxRepo
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH = int(os.getenv("OUTBOX_BATCH", 50))
+OUTBOX_POLL = float(os.getenv("OUTBOX_POLL", 5))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 5))
+OUTBOX_BACKOFF = float(os.getenv("OUTBOX_BACKOFF", 60))
+# Строка в статусе sending дольше этого срока считается брошенной упавшим процессом
+OUTBOX_LEASE = float(os.getenv("OUTBOX_LEASE", 300))
+
+outbox_repo = OutboxRepo(pool)
+
+
+# --- Диспетчер outbox ---
+# Забирает пачку готовых к отправке строк одним UPDATE ... RETURNING (строка
+# переходит в sending и достаётся только одному воркеру), отправляет письма
+# через очередь почты и отмечает итог одной транзакцией на пачку. После сбоя
+# процесса незавершённые строки возвращаются в работу по истечении аренды —
+# письмо может уйти повторно, но не потеряется. Текст письма собирает
+# builders[kind] — подтверждение записи, напоминание о старте курса и т.п.
+class OutboxDispatcher:
+    def __init__(self, mail_queue, builders, batch=OUTBOX_BATCH, poll=OUTBOX_POLL,
+                 max_attempts=OUTBOX_MAX_ATTEMPTS, backoff=OUTBOX_BACKOFF, lease=OUTBOX_LEASE):
+        self.mail_queue = mail_queue
+        self.builders = builders
+        self.batch = batch
+        self.poll = poll
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lease = lease
+        self.sent = 0
+        self.failed = 0
+        self.pending = 0
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+            metrics.OUTBOX_PENDING.set_function(lambda: self.pending)
+
+    def notify(self):
+        self._wakeup.set()
+
+    async def stop(self, timeout=30.0):
+        # Текущая пачка досылается и отмечается; новые строки не забираются
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Outbox не завершил пачку за {timeout} с, строки вернутся в работу после аренды")
+        self._task = None
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                rows = await self._claim()
+                if rows:
+                    await self._dispatch(rows)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка обработки outbox: {e}", exc_info=True)
+            if self._stopping:
+                return
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim(self):
+        now = time.time()
+        async with pool.writer() as db:
+            await db.execute("BEGIN IMMEDIATE")
+            rows = await outbox_repo.fetchall("claim", (now, now, now - self.lease, self.batch), db)
+            self.pending = await outbox_repo.fetchvalue("pending", db=db)
+        return rows
+
+    async def _send(self, email, course, kind):
+        try:
+            return await self.mail_queue.send(await self.builders[kind](email, course), wait=True)
+        except Exception as e:
+            return e
+
+    async def _dispatch(self, rows):
+        errors = await asyncio.gather(*(self._send(email, course, kind) for _, email, course, kind, _ in rows))
+        done, retry = [], []
+        now = time.time()
+        for (outbox_id, email, _, _, attempts), error in zip(rows, errors):
+            if error is None:
+                done.append((outbox_id,))
+                continue
+            attempts += 1
+            status = "failed" if attempts >= self.max_attempts else "pending"
+            retry.append((status, attempts, now + self.backoff * 2 ** (attempts - 1), str(error), outbox_id))
+            if status == "failed":
+                logger.error(f"Письмо на {email} не отправлено после {attempts} попыток: {error}")
+        async with pool.writer() as db:
+            await db.execute("BEGIN IMMEDIATE")
+            await outbox_repo.executemany(db, "mark_sent", done)
+            await outbox_repo.executemany(db, "mark_retry", retry)
+        self.sent += len(done)
+        self.failed += sum(1 for row in retry if row[0] == "failed")
@@ -0,0 +1,162 @@
+import argparse
+import asyncio
+import json
+import logging
+import pickle
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+import db
+from repos import PersistenceRepo
+
+logger = logging.getLogger(__name__)
+
+USER, CHAT, BOT, CALLBACK = "user", "chat", "bot", "callback"
+
+
+def _dumps(data):
+    return pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+# --- Персистентность PTB в SQLite ---
+# Вместо PicklePersistence, которая переписывает весь файл целиком, каждая запись
+# user_data/chat_data/bot_data и каждое состояние ConversationHandler хранятся
+# отдельной строкой в registrations.db. Пишутся только изменившиеся ключи;
+# обновления из одного цикла Application.update_persistence сливаются в одну транзакцию.
+# С shard=(index, count) загружаются только пользователи и чаты этого воркера
+# (см. workers.py); bot_data общая для всех воркеров — побеждает последняя запись.
+class SqlitePersistence(BasePersistence):
+    def __init__(self, path=db.DB_PATH, store_data=None, update_interval=60, shard=None):
+        super().__init__(store_data=store_data or PersistenceInput(), update_interval=update_interval)
+        self.path = path
+        self.shard = shard
+        self.repo = PersistenceRepo(db.pool)
+        self._data_writer = db.BatchWriter(self.repo, "save_data")
+        self._conversation_writer = db.BatchWriter(self.repo, "save_conversation")
+
+    async def _ensure_db(self):
+        # Application.initialize читает персистентность раньше post_init, поэтому
+        # пул открывается здесь; повторный init_db в post_init ничего не мигрирует.
+        if not db.pool.is_open:
+            await db.init_db(self.path)
+
+    def _owns(self, key):
+        if self.shard is None:
+            return True
+        index, count = self.shard
+        return key % count == index
+
+    async def _load(self, kind):
+        await self._ensure_db()
+        rows = await self.repo.fetchall("load_data", (kind,))
+        if kind in (USER, CHAT):
+            rows = [(key, data) for key, data in rows if self._owns(key)]
+        return {key: pickle.loads(data) for key, data in rows}
+
+    async def _delete(self, kind, key):
+        async with db.pool.writer() as conn:
+            await self.repo.execute(conn, "delete_data", (kind, key))
+
+    async def get_user_data(self):
+        return await self._load(USER)
+
+    async def get_chat_data(self):
+        return await self._load(CHAT)
+
+    async def get_bot_data(self):
+        return (await self._load(BOT)).get(0, {})
+
+    async def get_callback_data(self):
+        return (await self._load(CALLBACK)).get(0)
+
+    async def get_conversations(self, name):
+        await self._ensure_db()
+        rows = await self.repo.fetchall("load_conversations", (name,))
+        conversations = {}
+        for key, state in rows:
+            key = tuple(json.loads(key))
+            # Последний элемент ключа — id пользователя (per_user=True)
+            if self._owns(key[-1]):
+                conversations[key] = pickle.loads(state)
+        return conversations
+
+    async def update_conversation(self, name, key, new_state):
+        encoded = json.dumps(list(key))
+        if new_state is None:
+            async with db.pool.writer() as conn:
+                await self.repo.execute(conn, "delete_conversation", (name, encoded))
+            return
+        await self._conversation_writer.submit((name, encoded, _dumps(new_state)))
+
+    async def update_user_data(self, user_id, data):
+        await self._data_writer.submit((USER, user_id, _dumps(data)))
+
+    async def update_chat_data(self, chat_id, data):
+        await self._data_writer.submit((CHAT, chat_id, _dumps(data)))
+
+    async def update_bot_data(self, data):
+        await self._data_writer.submit((BOT, 0, _dumps(data)))
+
+    async def update_callback_data(self, data):
+        await self._data_writer.submit((CALLBACK, 0, _dumps(data)))
+
+    async def drop_user_data(self, user_id):
+        await self._delete(USER, user_id)
+
+    async def drop_chat_data(self, chat_id):
+        await self._delete(CHAT, chat_id)
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        await self._data_writer.close()
+        await self._conversation_writer.close()
+
+
+# --- Перенос данных из PicklePersistence ---
+class _Unpickler(pickle.Unpickler):
+    # PicklePersistence подменяет объект Bot постоянным идентификатором
+    def persistent_load(self, pid):
+        return None
+
+
+async def import_pickle(filepath, path=db.DB_PATH):
+    with open(filepath, "rb") as file:
+        data = _Unpickler(file).load()
+    await db.init_db(path)
+    try:
+        rows = [(USER, key, _dumps(value)) for key, value in data.get("user_data", {}).items()]
+        rows += [(CHAT, key, _dumps(value)) for key, value in data.get("chat_data", {}).items()]
+        if data.get("bot_data"):
+            rows.append((BOT, 0, _dumps(data["bot_data"])))
+        if data.get("callback_data"):
+            rows.append((CALLBACK, 0, _dumps(data["callback_data"])))
+        conversations = [
+            (name, json.dumps(list(key)), _dumps(state))
+            for name, states in data.get("conversations", {}).items()
+            for key, state in states.items()
+        ]
+        repo = PersistenceRepo(db.pool)
+        async with db.pool.writer() as conn:
+            await repo.executemany(conn, "save_data", rows)
+            await repo.executemany(conn, "save_conversation", conversations)
+    finally:
+        await db.close_db()
+    logger.info(f"Импортировано записей: {len(rows)}, состояний диалогов: {len(conversations)}")
+    return len(rows), len(conversations)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(asctime)s [%(levelname)s] %(message)s", level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Импорт файла PicklePersistence в SQLite")
+    parser.add_argument("pickle_file", nargs="?", default="bot_data")
+    parser.add_argument("--db", default=db.DB_PATH)
+    args = parser.parse_args()
+    asyncio.run(import_pickle(args.pickle_file, args.db))
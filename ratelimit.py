@@ -0,0 +1,147 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, CommandHandler, ConversationHandler, TypeHandler
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+IDLE_TTL = float(os.getenv("RATE_LIMIT_IDLE_TTL", 600))
+
+
+def _limit(name, default):
+    # Формат «N/S» — не больше N запросов за S секунд
+    burst, seconds = os.getenv(name, default).split("/")
+    return float(burst) / float(seconds), float(burst)
+
+
+LIMITS = {
+    "callback": _limit("RATE_LIMIT_CALLBACK", "10/10"),
+    "message": _limit("RATE_LIMIT_MESSAGE", "5/10"),
+}
+# У каждой команды своя корзина: лимит из RATE_LIMIT_<КОМАНДА> (например,
+# RATE_LIMIT_ADMIN), иначе из COMMAND_LIMITS, иначе RATE_LIMIT_COMMAND
+COMMAND_LIMIT = os.getenv("RATE_LIMIT_COMMAND", "5/10")
+COMMAND_LIMITS = {
+    "start": "3/30",
+}
+
+
+def command_limit(name):
+    return _limit(f"RATE_LIMIT_{name.upper()}", COMMAND_LIMITS.get(name, COMMAND_LIMIT))
+
+
+# --- Token bucket на пользователя ---
+# Корзины лежат в OrderedDict в порядке последнего обращения: проверка и
+# вытеснение давно неактивных пользователей — O(1) на запрос.
+class TokenBucketLimiter:
+    def __init__(self, rate, burst, idle_ttl=IDLE_TTL):
+        self.rate = rate
+        self.burst = burst
+        self.idle_ttl = idle_ttl
+        self._buckets = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def allow(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        self._evict(now)
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            tokens = self.burst
+        else:
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        return allowed
+
+    def _evict(self, now):
+        # Удаляем не больше двух корзин за вызов, чтобы не было всплесков задержки
+        for _ in range(2):
+            if not self._buckets:
+                return
+            key, (_, last) = next(iter(self._buckets.items()))
+            if now - last < self.idle_ttl:
+                return
+            del self._buckets[key]
+
+
+def classify(update):
+    if update.callback_query:
+        return "callback"
+    message = update.message
+    if message and message.text:
+        if message.text.startswith("/"):
+            command = message.text[1:].partition(" ")[0].partition("@")[0].lower()
+            if command:
+                return f"cmd:{command}"
+        return "message"
+    return None
+
+
+# --- Middleware для Application ---
+# Регистрируется TypeHandler'ом в группе -1: лишние апдейты останавливаются
+# ApplicationHandlerStop до того, как дойдут до обработчиков и базы.
+# Корзины команд создаются при первом обращении и только для команд, которые
+# есть в обработчиках приложения: неизвестные команды считаются сообщениями,
+# иначе перебором случайных /команд можно было бы обойти лимит.
+class RateLimiter:
+    def __init__(self, limits=LIMITS, commands=None):
+        self.limiters = {kind: TokenBucketLimiter(rate, burst) for kind, (rate, burst) in limits.items()}
+        self.commands = commands
+        self.dropped = 0
+
+    def limiter(self, kind, application):
+        if kind is None or kind in self.limiters:
+            return self.limiters.get(kind)
+        command = kind[len("cmd:"):]
+        if self.commands is None:
+            self.commands = registered_commands(application)
+        if command not in self.commands:
+            return self.limiters.get("message")
+        self.limiters[kind] = TokenBucketLimiter(*command_limit(command))
+        return self.limiters[kind]
+
+    async def __call__(self, update: Update, context):
+        user = update.effective_user
+        limiter = self.limiter(classify(update), context.application)
+        if user is None or limiter is None:
+            return
+        if not limiter.allow(user.id):
+            self.dropped += 1
+            metrics.RATE_LIMITED.inc()
+            logger.debug(f"Апдейт {update.update_id} от {user.id} отброшен ограничителем частоты")
+            raise ApplicationHandlerStop
+
+
+def _command_handlers(handlers):
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            yield from _command_handlers(handler.entry_points)
+            for state in handler.states.values():
+                yield from _command_handlers(state)
+            yield from _command_handlers(handler.fallbacks)
+        elif isinstance(handler, CommandHandler):
+            yield handler
+
+
+def registered_commands(application):
+    return {
+        command
+        for group in application.handlers.values()
+        for handler in _command_handlers(group)
+        for command in handler.commands
+    }
+
+
+def install(application, limits=LIMITS):
+    limiter = RateLimiter(limits)
+    application.add_handler(TypeHandler(Update, limiter), group=-1)
+    return limiter
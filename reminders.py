@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import os
+import time
+
+import background
+from db import course_repo, get_courses, pool, user_repo
+from repos import OutboxRepo, ReminderRepo
+
+logger = logging.getLogger(__name__)
+
+# За сколько часов до старта курса напоминать: "24,1" — за сутки и за час
+REMINDER_OFFSETS = tuple(float(h) * 3600 for h in os.getenv("REMINDER_OFFSETS_HOURS", "24,1").split(","))
+# Как часто подгружать из БД ближайшие напоминания в JobQueue, секунды
+REMINDER_LOAD_INTERVAL = float(os.getenv("REMINDER_LOAD_INTERVAL", 300))
+REMINDER_CHUNK = int(os.getenv("REMINDER_CHUNK", 200))
+# Напоминание в статусе running дольше этого срока брошено упавшим процессом
+REMINDER_LEASE = float(os.getenv("REMINDER_LEASE", 600))
+
+reminder_repo = ReminderRepo(pool)
+outbox_repo = OutboxRepo(pool)
+
+
+def format_start(starts_at):
+    return time.strftime("%d.%m.%Y %H:%M", time.localtime(starts_at))
+
+
+# --- Расписание ---
+# Дата старта хранится в courses.starts_at, по строке reminders на каждое
+# смещение из REMINDER_OFFSETS. Смена даты заменяет ещё не начатые напоминания.
+async def set_course_start(code, starts_at, offsets=REMINDER_OFFSETS):
+    # starts_at=None снимает дату; False — курса нет
+    now = time.time()
+    async with pool.writer() as db:
+        await db.execute("BEGIN IMMEDIATE")
+        if not await course_repo.execute(db, "set_starts_at", (starts_at, code)):
+            return False
+        await reminder_repo.execute(db, "clear_pending", (code,))
+        if starts_at is not None:
+            await reminder_repo.executemany(
+                db, "schedule", [(code, starts_at - offset) for offset in offsets if starts_at - offset > now]
+            )
+    return True
+
+async def get_course_start(code):
+    return await course_repo.fetchvalue("starts_at", (code,))
+
+
+# --- Планировщик напоминаний ---
+# Раз в REMINDER_LOAD_INTERVAL из reminders по индексу (status, run_at) читаются
+# только напоминания, наступающие в ближайшие два интервала, и ставятся в
+# JobQueue через run_once. Сработавшее напоминание захватывается UPDATE ...
+# RETURNING — при нескольких воркерах его отправит только один. Получатели —
+# записанные на курс, порциями по users.id через индекс idx_users_course_status;
+# после каждой порции прогресс сохраняется, и после перезапуска отправка
+# продолжается с места остановки. Письма кладутся в email_outbox той же
+# транзакцией, что и прогресс. Сообщения в Telegram идут через общий с
+# рассылками default_throttle — вместе они не превышают лимит Telegram.
+# broadcast импортируется при первой отправке, а не при старте бота.
+# Напоминания по уже начавшимся курсам (например, после простоя) не шлются.
+# Отправка идёт фоновой задачей (background.py), а не внутри задачи JobQueue:
+# иначе JobQueue.stop(wait=True) ждал бы, пока напоминание уйдёт всему курсу.
+class ReminderScheduler:
+    def __init__(self, interval=REMINDER_LOAD_INTERVAL, chunk=REMINDER_CHUNK, lease=REMINDER_LEASE,
+                 throttle=None):
+        self.interval = interval
+        self.chunk = chunk
+        self.lease = lease
+        self.throttle = throttle
+        self._scheduled = set()
+
+    async def expire(self):
+        async with pool.writer() as db:
+            expired = await reminder_repo.execute(db, "expire_stale", {"now": time.time()})
+        if expired:
+            logger.info(f"Пропущено напоминаний по начавшимся курсам: {expired}")
+        return expired
+
+    async def due(self, horizon):
+        now = time.time()
+        return await reminder_repo.fetchall("due", (now + horizon, now - self.lease))
+
+    async def load(self, job_queue):
+        await self.expire()
+        now = time.time()
+        loaded = 0
+        for reminder_id, run_at in await self.due(2 * self.interval):
+            if reminder_id in self._scheduled:
+                continue
+            self._scheduled.add(reminder_id)
+            job_queue.run_once(self._fire, when=max(run_at - now, 0), data=reminder_id, name=f"reminder_{reminder_id}")
+            loaded += 1
+        if loaded:
+            logger.info(f"Запланировано напоминаний: {loaded}")
+        return loaded
+
+    async def _load_job(self, context):
+        await self.load(context.job_queue)
+
+    async def _fire(self, context):
+        reminder_id = context.job.data
+        background.spawn(self._send(context.bot, reminder_id), name=f"reminder_{reminder_id}")
+
+    async def _send(self, bot, reminder_id):
+        try:
+            await self.run(bot, reminder_id)
+        except asyncio.CancelledError:
+            # Остановка: прогресс сохранён, напоминание вернётся к следующей подгрузке
+            await self._release(reminder_id)
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка отправки напоминания #{reminder_id}: {e}", exc_info=True)
+        finally:
+            self._scheduled.discard(reminder_id)
+
+    async def _release(self, reminder_id):
+        async with pool.writer() as db:
+            await reminder_repo.execute(db, "release", (reminder_id,))
+
+    async def _claim(self, reminder_id):
+        now = time.time()
+        async with pool.writer() as db:
+            return await reminder_repo.fetchone("claim", (now, reminder_id, now - self.lease), db)
+
+    async def _recipients(self, course, after):
+        return await user_repo.fetchall("enrolled_after", (course, after, self.chunk))
+
+    async def run(self, bot, reminder_id):
+        from broadcast import default_throttle, send_throttled
+
+        claimed = await self._claim(reminder_id)
+        if claimed is None:
+            return None
+        course, last, sent, failed = claimed
+        name = (await get_courses()).get(course, course)
+        starts_at = await get_course_start(course)
+        if starts_at is None or starts_at <= time.time():
+            async with pool.writer() as db:
+                await reminder_repo.execute(db, "finish", ("expired", reminder_id))
+            logger.info(f"Напоминание #{reminder_id} пропущено: курс {course} уже начался или без даты")
+            return None
+        text = f"⏰ Напоминаем: курс {name} начинается {format_start(starts_at)}"
+        while (chunk := await self._recipients(course, last)):
+            results = await asyncio.gather(*(
+                send_throttled(bot, self.throttle or default_throttle, telegram_id, text) for _, telegram_id, _ in chunk
+            ))
+            delivered = sum(results)
+            sent += delivered
+            failed += len(results) - delivered
+            last = chunk[-1][0]
+            async with pool.writer() as db:
+                await db.execute("BEGIN IMMEDIATE")
+                await outbox_repo.executemany(
+                    db, "queue_reminders", [(user_id, email, course) for user_id, _, email in chunk]
+                )
+                await reminder_repo.execute(db, "progress", (last, sent, failed, time.time(), reminder_id))
+            from emails_utils import outbox_dispatcher
+            outbox_dispatcher.notify()
+        async with pool.writer() as db:
+            await reminder_repo.execute(db, "finish", ("done", reminder_id))
+        logger.info(f"Напоминание #{reminder_id} по курсу {course}: доставлено {sent}, ошибок {failed}")
+        return sent, failed
+
+
+scheduler = ReminderScheduler()
+
+
+def install(application, interval=REMINDER_LOAD_INTERVAL):
+    if application.job_queue is None:
+        logger.warning("JobQueue недоступен (pip install \"python-telegram-bot[job-queue]\") — напоминания отключены")
+        return scheduler
+    scheduler.interval = interval
+    application.job_queue.run_repeating(scheduler._load_job, interval=interval, first=1, name="reminder_loader")
+    return scheduler
@@ -0,0 +1,337 @@
+import logging
+import os
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Порог медленного запроса в миллисекундах; 0 — профилирование выключено
+SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", 0))
+# План одного и того же запроса логируется не чаще раза в столько секунд
+EXPLAIN_INTERVAL = float(os.getenv("DB_EXPLAIN_INTERVAL", 60))
+
+
+# --- Профилирование запросов ---
+# Запрос дольше порога попадает в лог вместе с EXPLAIN QUERY PLAN, выполненным
+# на том же соединении с теми же параметрами: пропавший индекс виден как
+# SCAN вместо SEARCH. План строится не чаще EXPLAIN_INTERVAL на запрос, чтобы
+# при деградации не засыпать лог одинаковыми планами.
+class QueryProfiler:
+    def __init__(self, threshold_ms=SLOW_QUERY_MS, explain_interval=EXPLAIN_INTERVAL):
+        self.threshold = threshold_ms / 1000
+        self.explain_interval = explain_interval
+        self.slow = 0
+        self._explained = {}
+
+    def is_slow(self, elapsed):
+        return bool(self.threshold) and elapsed >= self.threshold
+
+    @staticmethod
+    async def explain(db, sql, params=()):
+        async with db.execute(f"EXPLAIN QUERY PLAN {sql}", params) as cursor:
+            rows = await cursor.fetchall()
+        depth = {0: 0}
+        lines = []
+        for node, parent, _, detail in rows:
+            depth[node] = depth.get(parent, 0) + 1
+            lines.append("  " * depth[node] + detail)
+        return "\n".join(lines)
+
+    async def observe(self, db, name, sql, params, elapsed):
+        self.slow += 1
+        metrics.DB_SLOW_QUERIES.labels(name).inc()
+        now = time.monotonic()
+        last = self._explained.get(name)
+        if last is not None and now - last < self.explain_interval:
+            logger.warning(f"Медленный запрос {name}: {elapsed * 1000:.1f} мс")
+            return
+        self._explained[name] = now
+        try:
+            plan = await self.explain(db, sql, params)
+        except Exception as e:
+            plan = f"  план недоступен: {e}"
+        logger.warning(f"Медленный запрос {name}: {elapsed * 1000:.1f} мс, план:\n{plan}")
+
+
+profiler = QueryProfiler()
+
+
+async def _fetchall(cursor):
+    return await cursor.fetchall()
+
+async def _fetchone(cursor):
+    return await cursor.fetchone()
+
+async def _rowcount(cursor):
+    return cursor.rowcount
+
+
+# --- Репозитории ---
+# Каждый репозиторий держит фиксированный набор именованных запросов. Текст
+# запроса всегда один и тот же объект, поэтому кэш подготовленных выражений
+# sqlite3 (cached_statements у каждого соединения пула) разбирает его один раз
+# на соединение. Чтение без db берёт соединение из пула сам; запись получает
+# соединение вызывающего, чтобы несколько запросов шли одной транзакцией.
+class Repo:
+    name = None
+    QUERIES = {}
+
+    def __init__(self, pool, profiler=profiler):
+        self.pool = pool
+        self.profiler = profiler
+
+    async def _run(self, db, name, params, fetch):
+        sql = self.QUERIES[name]
+        started = time.perf_counter()
+        async with db.execute(sql, params) as cursor:
+            result = await fetch(cursor)
+        elapsed = time.perf_counter() - started
+        if self.profiler is not None and self.profiler.is_slow(elapsed):
+            await self.profiler.observe(db, f"{self.name}.{name}", sql, params, elapsed)
+        return result
+
+    async def _read(self, name, params, fetch, db):
+        if db is not None:
+            return await self._run(db, name, params, fetch)
+        async with self.pool.reader() as db:
+            return await self._run(db, name, params, fetch)
+
+    async def fetchall(self, name, params=(), db=None):
+        return await self._read(name, params, _fetchall, db)
+
+    async def fetchone(self, name, params=(), db=None):
+        return await self._read(name, params, _fetchone, db)
+
+    async def fetchvalue(self, name, params=(), db=None):
+        row = await self.fetchone(name, params, db)
+        return row[0] if row else None
+
+    async def stream(self, name, params=(), chunk=500):
+        # Строки отдаются порциями по мере чтения; в профиль идёт только время
+        # в БД, без времени, которое вызывающий тратит на каждую порцию
+        sql = self.QUERIES[name]
+        elapsed = 0.0
+        async with self.pool.reader() as db:
+            started = time.perf_counter()
+            async with db.execute(sql, params) as cursor:
+                while rows := await cursor.fetchmany(chunk):
+                    elapsed += time.perf_counter() - started
+                    for row in rows:
+                        yield row
+                    started = time.perf_counter()
+            elapsed += time.perf_counter() - started
+            if self.profiler is not None and self.profiler.is_slow(elapsed):
+                await self.profiler.observe(db, f"{self.name}.{name}", sql, params, elapsed)
+
+    async def execute(self, db, name, params=()):
+        # Число затронутых строк
+        return await self._run(db, name, params, _rowcount)
+
+    async def executemany(self, db, name, rows):
+        # Для пачек план не строится: параметры — итератор, он уже израсходован
+        cursor = await db.executemany(self.QUERIES[name], rows)
+        count = cursor.rowcount
+        await cursor.close()
+        return count
+
+
+class CourseRepo(Repo):
+    name = "courses"
+    QUERIES = {
+        "all": "SELECT code, name FROM courses",
+        "add": "INSERT INTO courses (code, name) VALUES (?, ?)",
+        "rename": "UPDATE courses SET name = ? WHERE code = ?",
+        "delete": "DELETE FROM courses WHERE code = ?",
+        "registered": "SELECT COUNT(*) FROM users WHERE course = ?",
+        "set_capacity": "UPDATE courses SET capacity = ? WHERE code = ?",
+        "capacity": """
+            SELECT capacity,
+                (SELECT COUNT(*) FROM users WHERE course = :code AND status = 'enrolled'),
+                (SELECT COUNT(*) FROM users WHERE course = :code AND status = 'waitlisted')
+            FROM courses WHERE code = :code
+        """,
+        "free_seats": """
+            SELECT c.code, c.capacity - (
+                SELECT COUNT(*) FROM users u WHERE u.course = c.code AND u.status = 'enrolled'
+            )
+            FROM courses c WHERE c.capacity IS NOT NULL
+        """,
+        "starts_at": "SELECT starts_at FROM courses WHERE code = ?",
+        "set_starts_at": "UPDATE courses SET starts_at = ? WHERE code = ?",
+        "import": """
+            INSERT INTO courses (code, name) VALUES (?, ?)
+            ON CONFLICT (code) DO UPDATE SET name = excluded.name
+        """,
+        "export": "SELECT code, name FROM courses ORDER BY code",
+    }
+
+
+class UserRepo(Repo):
+    name = "users"
+    QUERIES = {
+        # Проверка и вставка одним атомарным запросом: email, занятый другим
+        # пользователем, отсекается NOT EXISTS по индексу idx_users_email, повторная
+        # запись на курс — уникальным индексом idx_user_course. Место на курсе
+        # резервируется тем же запросом, сверх capacity запись идёт в лист ожидания.
+        "register": """
+            INSERT INTO users (course, name, telegram_id, email, status)
+            SELECT :course, :name, :telegram_id, :email,
+                CASE WHEN (SELECT capacity FROM courses WHERE code = :course) IS NULL
+                          OR (SELECT COUNT(*) FROM users WHERE course = :course AND status = 'enrolled')
+                             < (SELECT capacity FROM courses WHERE code = :course)
+                     THEN 'enrolled' ELSE 'waitlisted' END
+            WHERE NOT EXISTS (
+                SELECT 1 FROM users WHERE email = :email AND telegram_id != :telegram_id
+            )
+            RETURNING id, status
+        """,
+        "queue_confirmation": """
+            INSERT INTO email_outbox (user_id, email, course)
+            SELECT id, email, course FROM users WHERE id = :id AND status = 'enrolled'
+        """,
+        "queue_confirmations": "INSERT INTO email_outbox (user_id, email, course) VALUES (?, ?, ?)",
+        "registered_courses": "SELECT course FROM users WHERE telegram_id = ?",
+        "cancel": "DELETE FROM users WHERE telegram_id = ? AND course = ? RETURNING status",
+        "promote": """
+            UPDATE users SET status = 'enrolled'
+            WHERE id IN (
+                SELECT id FROM users WHERE course = ? AND status = 'waitlisted' ORDER BY id LIMIT ?
+            )
+            RETURNING id, telegram_id, email
+        """,
+        "count_status": "SELECT COUNT(*) FROM users WHERE course = ? AND status = ?",
+        "enrolled_after": """
+            SELECT id, telegram_id, email FROM users
+            WHERE course = ? AND status = 'enrolled' AND id > ? ORDER BY id LIMIT ?
+        """,
+        "recipients_after": """
+            SELECT DISTINCT telegram_id FROM users WHERE telegram_id > ? ORDER BY telegram_id LIMIT ?
+        """,
+        # Записи на несуществующий курс, повторы и чужие email пропускаются;
+        # места распределяются так же, как в "register"
+        "import": """
+            INSERT OR IGNORE INTO users (course, name, telegram_id, email, status)
+            SELECT ?1, ?2, ?3, ?4,
+                CASE WHEN (SELECT capacity FROM courses WHERE code = ?1) IS NULL
+                          OR (SELECT COUNT(*) FROM users WHERE course = ?1 AND status = 'enrolled')
+                             < (SELECT capacity FROM courses WHERE code = ?1)
+                     THEN 'enrolled' ELSE 'waitlisted' END
+            WHERE EXISTS (SELECT 1 FROM courses WHERE code = ?1)
+              AND NOT EXISTS (SELECT 1 FROM users WHERE email = ?4 AND telegram_id != ?3)
+        """,
+        "export": "SELECT id, course, name, telegram_id, email, status FROM users ORDER BY id",
+    }
+
+
+class PersistenceRepo(Repo):
+    name = "persistence"
+    QUERIES = {
+        "load_data": "SELECT key, data FROM persistence_data WHERE kind = ?",
+        "save_data": """
+            INSERT INTO persistence_data (kind, key, data) VALUES (?, ?, ?)
+            ON CONFLICT (kind, key) DO UPDATE SET data = excluded.data
+        """,
+        "delete_data": "DELETE FROM persistence_data WHERE kind = ? AND key = ?",
+        "load_conversations": "SELECT key, state FROM persistence_conversations WHERE name = ?",
+        "save_conversation": """
+            INSERT INTO persistence_conversations (name, key, state) VALUES (?, ?, ?)
+            ON CONFLICT (name, key) DO UPDATE SET state = excluded.state
+        """,
+        "delete_conversation": "DELETE FROM persistence_conversations WHERE name = ? AND key = ?",
+    }
+
+
+class AdminRepo(Repo):
+    name = "admins"
+    QUERIES = {
+        "all": "SELECT telegram_id, role FROM admins",
+        "seed_owner": """
+            INSERT INTO admins (telegram_id, role)
+            SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM admins)
+        """,
+        "grant": """
+            INSERT INTO admins (telegram_id, role, added_by) VALUES (?, ?, ?)
+            ON CONFLICT (telegram_id) DO UPDATE SET role = excluded.role, added_by = excluded.added_by
+        """,
+        "revoke": "DELETE FROM admins WHERE telegram_id = ?",
+    }
+
+
+class OutboxRepo(Repo):
+    name = "outbox"
+    QUERIES = {
+        # Строка переходит в sending и достаётся только одному воркеру; брошенные
+        # упавшим процессом строки забираются снова по истечении аренды
+        "claim": """
+            UPDATE email_outbox SET status = 'sending', claimed_at = ?
+            WHERE id IN (
+                SELECT id FROM email_outbox
+                WHERE (status = 'pending' AND next_attempt_at <= ?)
+                   OR (status = 'sending' AND claimed_at < ?)
+                ORDER BY id LIMIT ?
+            )
+            RETURNING id, email, course, kind, attempts
+        """,
+        "pending": "SELECT COUNT(*) FROM email_outbox WHERE status = 'pending'",
+        "mark_sent": "UPDATE email_outbox SET status = 'sent', claimed_at = NULL WHERE id = ?",
+        "mark_retry": """
+            UPDATE email_outbox SET status = ?, attempts = ?, next_attempt_at = ?,
+                last_error = ?, claimed_at = NULL
+            WHERE id = ?
+        """,
+        "queue_reminders": "INSERT INTO email_outbox (user_id, email, course, kind) VALUES (?, ?, ?, 'reminder')",
+    }
+
+
+class ReminderRepo(Repo):
+    name = "reminders"
+    QUERIES = {
+        "clear_pending": "DELETE FROM reminders WHERE course = ? AND status = 'pending'",
+        "schedule": "INSERT OR IGNORE INTO reminders (course, run_at) VALUES (?, ?)",
+        # Курс уже начался или дата снята — напоминать поздно
+        "expire_stale": """
+            UPDATE reminders SET status = 'expired'
+            WHERE status = 'pending' AND run_at <= :now AND NOT EXISTS (
+                SELECT 1 FROM courses WHERE code = reminders.course AND starts_at > :now
+            )
+        """,
+        "due": """
+            SELECT id, run_at FROM reminders WHERE status = 'pending' AND run_at <= ?
+            UNION ALL
+            SELECT id, run_at FROM reminders WHERE status = 'running' AND claimed_at < ?
+        """,
+        "claim": """
+            UPDATE reminders SET status = 'running', claimed_at = ?
+            WHERE id = ? AND (status = 'pending' OR (status = 'running' AND claimed_at < ?))
+            RETURNING course, last_user_id, sent, failed
+        """,
+        "progress": "UPDATE reminders SET last_user_id = ?, sent = ?, failed = ?, claimed_at = ? WHERE id = ?",
+        "release": "UPDATE reminders SET status = 'pending', claimed_at = NULL WHERE id = ? AND status = 'running'",
+        "finish": "UPDATE reminders SET status = ? WHERE id = ?",
+    }
+
+
+class BroadcastRepo(Repo):
+    name = "broadcasts"
+    QUERIES = {
+        "create": "INSERT INTO broadcasts (text) VALUES (?) RETURNING id",
+        "get": "SELECT text, last_telegram_id, sent, failed FROM broadcasts WHERE id = ?",
+        "progress": "UPDATE broadcasts SET last_telegram_id = ?, sent = ?, failed = ? WHERE id = ?",
+        "finish": "UPDATE broadcasts SET status = 'done' WHERE id = ?",
+        "running": "SELECT id FROM broadcasts WHERE status = 'running'",
+    }
+
+
+class DedupRepo(Repo):
+    name = "seen_updates"
+    QUERIES = {
+        "recent": "SELECT update_id FROM seen_updates ORDER BY update_id DESC LIMIT ?",
+        "add": "INSERT OR IGNORE INTO seen_updates (update_id) VALUES (?)",
+        # Таблица обрезается до размера окна
+        "trim": """
+            DELETE FROM seen_updates WHERE update_id < (
+                SELECT update_id FROM seen_updates ORDER BY update_id DESC LIMIT 1 OFFSET ?
+            )
+        """,
+    }
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import os
+import time
+from types import MappingProxyType
+
+from db import pool
+from repos import AdminRepo
+
+logger = logging.getLogger(__name__)
+
+ROLE_CACHE_TTL = float(os.getenv("ROLE_CACHE_TTL", 60))
+
+# Роли по возрастанию прав: каждая следующая включает предыдущие
+VIEWER, COURSE_MANAGER, OWNER = "viewer", "course_manager", "owner"
+ROLES = (VIEWER, COURSE_MANAGER, OWNER)
+_RANK = {role: rank for rank, role in enumerate(ROLES)}
+
+
+def has_role(role, required):
+    return role is not None and _RANK[role] >= _RANK[required]
+
+
+# --- Кэш ролей ---
+# Проверка прав — поиск в словаре без обращения к БД. Кэш перечитывается после
+# каждого изменения в этом процессе и по TTL, чтобы подхватить изменения,
+# сделанные другими воркерами.
+class RoleCache:
+    def __init__(self, ttl=ROLE_CACHE_TTL):
+        self.ttl = ttl
+        self._roles = None
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self):
+        if self._roles is None:
+            return False
+        return not self.ttl or time.monotonic() - self._loaded_at < self.ttl
+
+    async def get(self, telegram_id):
+        if not self._is_fresh():
+            async with self._lock:
+                if not self._is_fresh():
+                    await self.refresh()
+        return self._roles.get(telegram_id)
+
+    async def all(self):
+        if not self._is_fresh():
+            await self.refresh()
+        return self._roles
+
+    async def refresh(self):
+        roles = dict(await admin_repo.fetchall("all"))
+        self._roles = MappingProxyType(roles)
+        self._loaded_at = time.monotonic()
+        return self._roles
+
+    def invalidate(self):
+        self._roles = None
+
+
+admin_repo = AdminRepo(pool)
+role_cache = RoleCache()
+
+
+async def get_role(telegram_id):
+    return await role_cache.get(telegram_id)
+
+async def ensure_owner(telegram_id):
+    # ADMIN_ID из окружения — первый владелец, только пока таблица admins пуста;
+    # дальше список ведётся из бота, и /revoke не отменяется перезапуском
+    if not telegram_id:
+        return
+    async with pool.writer() as db:
+        seeded = await admin_repo.execute(db, "seed_owner", (telegram_id, OWNER)) > 0
+    if seeded:
+        logger.info(f"Пользователь {telegram_id} (ADMIN_ID) добавлен первым владельцем")
+    await role_cache.refresh()
+
+async def grant_role(telegram_id, role, added_by=None):
+    if role not in _RANK:
+        raise ValueError(f"Неизвестная роль: {role}")
+    async with pool.writer() as db:
+        await admin_repo.execute(db, "grant", (telegram_id, role, added_by))
+    await role_cache.refresh()
+    logger.info(f"Пользователю {telegram_id} выдана роль {role} (выдал {added_by})")
+
+async def revoke_role(telegram_id):
+    async with pool.writer() as db:
+        revoked = await admin_repo.execute(db, "revoke", (telegram_id,)) > 0
+    await role_cache.refresh()
+    return revoked
@@ -0,0 +1,129 @@
+import logging
+import os
+import pickle
+import time
+
+from telegram import Update
+from telegram.ext import ConversationHandler, TypeHandler
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CONV_TIMEOUT = float(os.getenv("CONV_TIMEOUT", 1800))
+SWEEP_INTERVAL = float(os.getenv("SWEEP_INTERVAL", 300))
+
+
+def state_timeouts(prefix, states, default=CONV_TIMEOUT):
+    # REG_TIMEOUT_EMAIL=600 — таймаут шага EMAIL диалога регистрации, в секундах
+    return {state: float(os.getenv(f"{prefix}_{name}", default)) for name, state in states.items()}
+
+
+def _size(value):
+    try:
+        return len(pickle.dumps(value))
+    except Exception:
+        return 0
+
+
+# --- Уборка брошенных диалогов ---
+# ConversationHandler из PTB знает только один таймаут на весь диалог, и его
+# задачи не переживают перезапуск. Здесь время последнего апдейта пользователя
+# отмечается в отдельной группе, а периодическая задача JobQueue завершает
+# диалоги, простоявшие на своём шаге дольше таймаута этого шага, и удаляет
+# промежуточные ключи user_data. Затронутые user_data помечаются для записи
+# и уходят в персистентность обычным update_persistence.
+class ConversationSweeper:
+    def __init__(self):
+        self._tracked = []
+        self.transient_keys = set()
+        self._last_seen = {}
+        self.reclaimed = {"conversations": 0, "user_data_keys": 0, "users": 0, "bytes": 0}
+
+    def track(self, conversation, timeouts, user_data_keys=()):
+        self._tracked.append((conversation, timeouts))
+        self.transient_keys.update(user_data_keys)
+
+    def clear_user_data(self, user_data):
+        freed = 0
+        for key in self.transient_keys & user_data.keys():
+            freed += _size(user_data.pop(key))
+        return freed
+
+    async def touch(self, update: Update, context):
+        if update.effective_user:
+            self._last_seen[update.effective_user.id] = time.monotonic()
+
+    def _idle(self, user_id, now):
+        # Диалоги, восстановленные из БД после перезапуска, отсчитываются с первой уборки
+        return now - self._last_seen.setdefault(user_id, now)
+
+    def sweep(self, application, now=None):
+        now = time.monotonic() if now is None else now
+        stats = dict.fromkeys(self.reclaimed, 0)
+        active = set()
+        for conversation, timeouts in self._tracked:
+            # Публичного способа завершить чужой диалог в PTB нет
+            conversations = conversation._conversations
+            for key, state in list(conversations.items()):
+                user_id = key[-1]
+                timeout = timeouts.get(state) if isinstance(state, int) else None
+                if timeout is None or self._idle(user_id, now) <= timeout:
+                    active.add(user_id)
+                    continue
+                stats["bytes"] += _size(state)
+                conversation._update_state(ConversationHandler.END, key)
+                stats["conversations"] += 1
+
+        max_timeout = max((max(t.values(), default=CONV_TIMEOUT) for _, t in self._tracked), default=CONV_TIMEOUT)
+        cleared = []
+        for user_id, user_data in list(application.user_data.items()):
+            if user_id in active or self._idle(user_id, now) <= max_timeout:
+                continue
+            keys = len(self.transient_keys & user_data.keys())
+            if keys:
+                stats["bytes"] += self.clear_user_data(user_data)
+                stats["user_data_keys"] += keys
+            if not user_data:
+                application.drop_user_data(user_id)
+                stats["users"] += 1
+            elif keys:
+                cleared.append(user_id)
+        # Словари user_data меняются в обход обработчиков — PTB сам не заметит
+        # изменений и не запишет их в персистентность
+        if cleared:
+            application.mark_data_for_update_persistence(user_ids=cleared)
+
+        for user_id, seen in list(self._last_seen.items()):
+            if user_id not in active and now - seen > max_timeout:
+                del self._last_seen[user_id]
+
+        for kind, value in stats.items():
+            self.reclaimed[kind] += value
+            _RECLAIMED[kind].inc(value)
+        if stats["conversations"] or stats["user_data_keys"] or stats["users"]:
+            logger.info(
+                f"Уборка сессий: завершено диалогов {stats['conversations']}, удалено ключей user_data "
+                f"{stats['user_data_keys']}, пользователей {stats['users']}, ~{stats['bytes']} байт"
+            )
+        return stats
+
+    async def _job(self, context):
+        self.sweep(context.application)
+
+
+_RECLAIMED = {
+    kind: metrics.SESSIONS_RECLAIMED.labels(kind)
+    for kind in ("conversations", "user_data_keys", "users", "bytes")
+}
+
+sweeper = ConversationSweeper()
+
+
+def install(application, interval=SWEEP_INTERVAL):
+    application.add_handler(TypeHandler(Update, sweeper.touch), group=-2)
+    if application.job_queue is None:
+        logger.warning("JobQueue недоступен (pip install \"python-telegram-bot[job-queue]\") — уборка сессий отключена")
+        return sweeper
+    application.job_queue.run_repeating(sweeper._job, interval=interval, first=interval, name="session_sweeper")
+    return sweeper
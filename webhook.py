@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import os
+import signal
+import time
+
+from aiohttp import web
+from telegram import Update
+
+import background
+import metrics
+from ingest import Ingest, loads
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = "/webhook"
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "https://YOUR_DOMAIN/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 5000))
+# Размер очереди апдейтов: когда обработчики не успевают, приём webhook ждёт свободного места
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", 1000))
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+APPLICATION_KEY = web.AppKey("application", object)
+SECRET_TOKEN_KEY = web.AppKey("secret_token", object)
+INGEST_KEY = web.AppKey("ingest", Ingest)
+
+
+def update_queue():
+    return asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE)
+
+
+async def handle_webhook(request):
+    started = time.perf_counter()
+    response = await _accept_update(request)
+    metrics.WEBHOOK_LATENCY.labels(response.status).observe(time.perf_counter() - started)
+    return response
+
+
+async def _accept_update(request):
+    application = request.app[APPLICATION_KEY]
+    secret_token = request.app[SECRET_TOKEN_KEY]
+    if secret_token and request.headers.get(SECRET_HEADER) != secret_token:
+        return web.Response(status=403)
+    try:
+        data = loads(await request.read())
+    except ValueError:
+        return web.Response(status=400)
+    if not isinstance(data, dict):
+        return web.Response(status=400)
+    # Отброшенный апдейт тоже подтверждаем 200, иначе Telegram пришлёт его снова
+    if request.app[INGEST_KEY].accept(data) is not None:
+        await application.update_queue.put(Update.de_json(data, application.bot))
+    return web.Response(text="OK")
+
+
+async def handle_metrics(request):
+    return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+
+def create_webhook_app(application, secret_token=WEBHOOK_SECRET, path=WEBHOOK_PATH, ingest=None):
+    app = web.Application()
+    app[APPLICATION_KEY] = application
+    app[SECRET_TOKEN_KEY] = secret_token
+    app[INGEST_KEY] = ingest or Ingest()
+    app.router.add_post(path, handle_webhook)
+    app.router.add_get("/metrics", handle_metrics)
+    return app
+
+
+# --- Запуск webhook-сервера в одном event loop с Application ---
+# Повторяет жизненный цикл Application.run_webhook: initialize → post_init → start,
+# а при остановке отмена фоновых задач → stop → post_stop → shutdown → post_shutdown.
+async def serve(application, web_app=None, *, host=WEBHOOK_HOST, port=WEBHOOK_PORT,
+                url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET):
+    if web_app is None:
+        web_app = create_webhook_app(application, secret_token)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    runner = web.AppRunner(web_app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+        if url:
+            await application.bot.set_webhook(url, secret_token=secret_token)
+        logger.info(f"Бот готов, webhook слушает {host}:{port}")
+        await stop_event.wait()
+    finally:
+        await runner.cleanup()
+        # Рассылки сохраняют прогресс порциями и продолжатся после перезапуска
+        await background.cancel_all()
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
@@ -0,0 +1,203 @@
+import argparse
+import asyncio
+import importlib
+import logging
+import os
+import secrets
+import signal
+import sys
+
+from aiohttp import ClientError, ClientSession, web
+
+from ingest import loads
+from webhook import (
+    SECRET_HEADER, UPDATE_QUEUE_SIZE, WEBHOOK_HOST, WEBHOOK_PATH, WEBHOOK_PORT,
+    WEBHOOK_SECRET, WEBHOOK_URL, serve
+)
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.getenv("WORKERS", os.cpu_count() or 1))
+WORKER_BASE_PORT = int(os.getenv("WORKER_BASE_PORT", 5100))
+RESTART_BACKOFF_MAX = 30
+
+# Поля апдейта, в которых лежит объект с отправителем
+UPDATE_KINDS = (
+    "message", "edited_message", "callback_query", "inline_query", "chosen_inline_result",
+    "shipping_query", "pre_checkout_query", "poll_answer", "my_chat_member", "chat_member",
+    "chat_join_request", "business_message", "edited_business_message",
+)
+
+
+# --- Шардирование апдейтов по пользователю ---
+# Все апдейты одного пользователя попадают в один и тот же воркер и идут туда
+# строго по очереди, поэтому порядок шагов диалога сохраняется, а состояние
+# ConversationHandler и user_data живут только в одном процессе.
+def update_user_id(data):
+    for kind in UPDATE_KINDS:
+        obj = data.get(kind)
+        if obj:
+            user = obj.get("from") or obj.get("user")
+            if user:
+                return user["id"]
+    return data.get("update_id", 0)
+
+
+def shard_of(user_id, count):
+    return user_id % count
+
+
+def current_shard():
+    value = os.getenv("WORKER_SHARD")
+    if not value:
+        return None
+    index, count = value.split("/")
+    return int(index), int(count)
+
+
+class Worker:
+    def __init__(self, index, count, app_module, secret):
+        self.index = index
+        self.count = count
+        self.app_module = app_module
+        self.secret = secret
+        self.port = WORKER_BASE_PORT + index
+        self.queue = asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE)
+        self.process = None
+        self.restarts = 0
+
+    async def spawn(self):
+        env = dict(
+            os.environ,
+            WORKER_SHARD=f"{self.index}/{self.count}",
+            WORKER_PORT=str(self.port),
+            WORKER_SECRET=self.secret,
+            # Каталог курсов меняет один процесс — остальные перечитывают его по TTL
+            COURSE_CACHE_TTL=os.getenv("COURSE_CACHE_TTL", "30"),
+        )
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__), "--run-worker", self.app_module, env=env
+        )
+        logger.info(f"Воркер {self.index} запущен, pid {self.process.pid}, порт {self.port}")
+
+    async def supervise(self, stopping):
+        while not stopping.is_set():
+            await self.spawn()
+            code = await self.process.wait()
+            if stopping.is_set():
+                return
+            self.restarts += 1
+            delay = min(RESTART_BACKOFF_MAX, 2 ** min(self.restarts, 5))
+            logger.error(f"Воркер {self.index} завершился с кодом {code}, перезапуск через {delay} с")
+            await asyncio.sleep(delay)
+
+    async def forward(self, session):
+        url = f"http://127.0.0.1:{self.port}{WEBHOOK_PATH}"
+        headers = {SECRET_HEADER: self.secret, "Content-Type": "application/json"}
+        while True:
+            body = await self.queue.get()
+            # Пока воркер стартует или перезапускается, апдейт ждёт в очереди
+            while True:
+                try:
+                    async with session.post(url, data=body, headers=headers) as resp:
+                        if resp.status == 200:
+                            break
+                        if resp.status < 500:
+                            logger.error(f"Воркер {self.index} отклонил апдейт: HTTP {resp.status}")
+                            break
+                except ClientError:
+                    pass
+                await asyncio.sleep(0.5)
+            self.queue.task_done()
+
+    async def stop(self, timeout=30):
+        if self.process is None or self.process.returncode is not None:
+            return
+        self.process.send_signal(signal.SIGTERM)
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout)
+        except asyncio.TimeoutError:
+            self.process.kill()
+
+
+WORKERS_KEY = web.AppKey("workers", list)
+
+
+async def handle_front(request):
+    if WEBHOOK_SECRET and request.headers.get(SECRET_HEADER) != WEBHOOK_SECRET:
+        return web.Response(status=403)
+    body = await request.read()
+    try:
+        data = loads(body)
+    except ValueError:
+        return web.Response(status=400)
+    if not isinstance(data, dict):
+        return web.Response(status=400)
+    workers = request.app[WORKERS_KEY]
+    await workers[shard_of(update_user_id(data), len(workers))].queue.put(body)
+    return web.Response(text="OK")
+
+
+async def run_front(app_module, count, host=WEBHOOK_HOST, port=WEBHOOK_PORT):
+    secret = secrets.token_urlsafe(32)
+    workers = [Worker(index, count, app_module, secret) for index in range(count)]
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    supervisors = [asyncio.create_task(worker.supervise(stopping)) for worker in workers]
+    session = ClientSession()
+    forwarders = [asyncio.create_task(worker.forward(session)) for worker in workers]
+
+    app = web.Application()
+    app[WORKERS_KEY] = workers
+    app.router.add_post(WEBHOOK_PATH, handle_front)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    token = os.getenv("BOT_TOKEN")
+    if WEBHOOK_URL and token:
+        from telegram import Bot
+
+        async with Bot(token) as bot:
+            await bot.set_webhook(WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+    logger.info(f"Фронтенд webhook слушает {host}:{port}, воркеров: {count}")
+
+    try:
+        await stopping.wait()
+    finally:
+        await runner.cleanup()
+        try:
+            await asyncio.wait_for(asyncio.gather(*(worker.queue.join() for worker in workers)), 30)
+        except asyncio.TimeoutError:
+            logger.warning("Не все апдейты переданы воркерам до остановки")
+        for task in forwarders:
+            task.cancel()
+        await session.close()
+        await asyncio.gather(*(worker.stop() for worker in workers))
+        await asyncio.gather(*supervisors, return_exceptions=True)
+
+
+def run_worker(app_module):
+    module = importlib.import_module(app_module)
+    asyncio.run(serve(
+        module.build_application(),
+        host="127.0.0.1",
+        port=int(os.environ["WORKER_PORT"]),
+        url=None,
+        secret_token=os.environ["WORKER_SECRET"],
+    ))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Webhook-фронтенд с шардированием по пользователям")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--app", default="app", help="модуль с фабрикой build_application")
+    parser.add_argument("--run-worker", metavar="MODULE", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    logging.basicConfig(format="%(asctime)s [%(levelname)s] %(message)s", level=logging.INFO)
+    if args.run_worker:
+        run_worker(args.run_worker)
+    else:
+        asyncio.run(run_front(args.app, args.workers))